@@ -0,0 +1,231 @@
+# benchmarks for the hot paths of meteors: updating the objects, the collision
+#  pass, removing dead objects and drawing. each scenario builds a game with a
+#  fixed seed, runs it for a number of frames, and times every phase of every
+#  frame. the results are printed as json so runs can be compared.
+#
+# python bench.py [--frames N] [--scenario NAME ...] [--store] [--draw [--headless]]
+#                 [--instanced] [--continuous] [--out FILE]
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+# the clock with the best resolution there is
+if hasattr(time, 'perf_counter'):
+    clock = time.perf_counter
+else:
+    clock = time.time
+
+
+def percentile(values, p):
+    # nearest rank percentile of a list of numbers
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = int(round(p / 100.0 * (len(ordered) - 1)))
+    return ordered[rank]
+
+
+def summary(times):
+    # times in seconds, summary in milliseconds
+    return {
+        'mean_ms': 1000.0 * sum(times) / max(len(times), 1),
+        'p50_ms': 1000.0 * percentile(times, 50),
+        'p99_ms': 1000.0 * percentile(times, 99),
+        'max_ms': 1000.0 * max(times or [0.0])}
+
+
+def make_bench_game(meteors):
+    # a Game whose ship can't die, so every scenario keeps its objects (and their
+    #  cost) for all of its frames. the ship vs meteor test still runs
+    class BenchGame(meteors.Game):
+        ship_hits = 0
+
+        def _ch_ship_meteor(self, ship, meteor):
+            self.ship_hits = self.ship_hits + 1
+
+    return BenchGame
+
+
+# scenarios. each one takes a new game on its start screen and sets it up, and
+#  returns a function that is called before every frame (to steer the ship)
+
+def scenario_level_1(m, game):
+    game.on_key(m.key.ENTER, 0, True)
+    return shoot(m, game)
+
+
+def scenario_level_20(m, game):
+    game.level = 20
+    game.on_key(m.key.ENTER, 0, True)
+    return shoot(m, game)
+
+
+def scenario_split_burst(m, game):
+    # lots of meteors that were just split, all starting from a few points
+    game.on_key(m.key.ENTER, 0, True)
+    (winx, winy) = game.bounds.get_size()
+    for i in range(8):
+        pos = m.Vector2(game.random.uniform(0, winx), game.random.uniform(0, winy))
+        game.add_meteor2(pos)
+        game.add_meteor3(pos)
+    return shoot(m, game)
+
+
+def scenario_dense_field(m, game):
+    # the ship flies (and shoots) through a field full of meteors of all sizes
+    game.on_key(m.key.ENTER, 0, True)
+    (winx, winy) = game.bounds.get_size()
+    for meteor_class in (m.Meteor1, m.Meteor2, m.Meteor3):
+        for i in range(30):
+            pos = m.Vector2(game.random.uniform(0, winx), game.random.uniform(0, winy))
+            meteor = meteor_class(pos, game.random.uniform(0, 360), game.random)
+            game.add_item(meteor)
+    game.on_key(m.key.UP, 0, True)
+    steer = shoot(m, game)
+
+    def frame(index):
+        # turn a bit every now and then
+        if index % 90 == 0:
+            game.on_key(m.key.LEFT, 0, True)
+        elif index % 90 == 20:
+            game.on_key(m.key.LEFT, 0, False)
+        steer(index)
+    return frame
+
+
+def scenario_rapid_fire(m, game):
+    # the dense field again, with the fire key held down on a rapid fire weapon
+    frame = scenario_dense_field(m, game)
+    game.on_key(m.key.SPACE, 0, True)
+    return frame
+
+
+def shoot(m, game):
+    def frame(index):
+        if game.state == m.STATE.play:
+            game.add_bullet()
+    return frame
+
+
+# name: (scenario, world size, weapon (fire rate, max bullets) or None)
+scenarios = {
+    'level_1': (scenario_level_1, (640, 480), None),
+    'level_20': (scenario_level_20, (1600, 1200), None),
+    'split_burst': (scenario_split_burst, (800, 600), None),
+    'dense_field': (scenario_dense_field, (1024, 768), None),
+    'rapid_fire': (scenario_rapid_fire, (1024, 768), (60, 500))}
+scenario_order = ['level_1', 'level_20', 'split_burst', 'dense_field', 'rapid_fire']
+
+
+def run(m, name, args):
+    (setup, (width, height), weapon) = scenarios[name]
+    if weapon:
+        weapon = m.Weapon(*weapon)
+    window = None
+    if args.draw:
+        window = m.pyglet.window.Window(width, height, visible = False)
+        window.switch_to()
+        window.on_resize(width, height)
+    game = make_bench_game(m)(window, bounds = m.WorldBounds(width, height),
+                              meteor_store = args.store,
+                              instanced_meteors = args.instanced, seed = args.seed,
+                              continuous = args.continuous, weapon = weapon,
+                              profile = False)
+    frame = setup(m, game)
+
+    phases = {'update': [], 'collision': [], 'removal': [], 'draw': []}
+    frames = []
+    items = 0
+    for index in range(args.warmup + args.frames):
+        frame(index)
+        t0 = clock()
+        game.update_items(game.fixed_dt)
+        t1 = clock()
+        if game.state == m.STATE.play:
+            game.collide_items()
+        t2 = clock()
+        game.remove_items()
+        t3 = clock()
+        if window:
+            game.draw()
+            m.glFinish()
+        t4 = clock()
+        if index < args.warmup:
+            continue
+        phases['update'].append(t1 - t0)
+        phases['collision'].append(t2 - t1)
+        phases['removal'].append(t3 - t2)
+        phases['draw'].append(t4 - t3)
+        frames.append(t4 - t0)
+        items = items + sum(len(pool) for pool in game.pools)
+    if window:
+        window.close()
+
+    result = {
+        'frames': args.frames,
+        'world': [width, height],
+        'mean_objects': float(items) / max(args.frames, 1),
+        'ship_hits': game.ship_hits,
+        'score': game.score,
+        'frame': summary(frames),
+        'fps': args.frames / max(sum(frames), 1e-9)}
+    for phase in phases:
+        if phase == 'draw' and not window:
+            result[phase] = None
+        else:
+            result[phase] = summary(phases[phase])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'benchmark meteors')
+    parser.add_argument('--frames', type = int, default = 600)
+    parser.add_argument('--warmup', type = int, default = 30)
+    parser.add_argument('--seed', type = int, default = 1)
+    parser.add_argument('--scenario', action = 'append', choices = scenario_order,
+                        help = 'run only this scenario (can be repeated)')
+    parser.add_argument('--store', action = 'store_true',
+                        help = 'update meteors through a MeteorStore')
+    parser.add_argument('--draw', action = 'store_true',
+                        help = 'draw into a hidden window, and time it')
+    parser.add_argument('--headless', action = 'store_true',
+                        help = 'draw without a display (pyglet headless mode)')
+    parser.add_argument('--instanced', action = 'store_true',
+                        help = 'draw meteors with the instanced renderer')
+    parser.add_argument('--continuous', action = 'store_true',
+                        help = 'continuous bullet collision detection')
+    parser.add_argument('--out', help = 'write the json here instead of stdout')
+    args = parser.parse_args()
+
+    if args.headless:
+        # has to be set before pyglet.window is imported
+        import pyglet
+        pyglet.options['headless'] = True
+    import meteors
+    if args.draw and meteors.pyglet is None:
+        sys.exit('--draw needs pyglet and a display, or --headless (%s)' % meteors.pyglet_error)
+
+    results = {
+        'python': platform.python_version(),
+        'numpy': meteors.numpy != None,
+        'store': args.store,
+        'instanced': args.instanced,
+        'continuous': args.continuous,
+        'seed': args.seed,
+        'scenarios': {}}
+    for name in args.scenario or scenario_order:
+        results['scenarios'][name] = run(meteors, name, args)
+
+    text = json.dumps(results, indent = 2, sort_keys = True)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
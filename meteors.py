@@ -1,8 +1,32 @@
 import random
 import math
-import pyglet
-from pyglet.gl import *
-from pyglet.window import key
+import inspect
+import ctypes
+import struct
+import sys
+import time
+# either pyglet isn't installed, or there is no display to open a gl context on (pyglet
+#  opens one as soon as pyglet.gl is imported). the game can then still be simulated
+#  headless (see WorldBounds and Game.step), and pyglet_error says why it can't be played
+pyglet_error = None
+try:
+    import pyglet
+    from pyglet.gl import *
+    from pyglet.window import key
+except ImportError as error:
+    pyglet_error = error
+except Exception as error:
+    # raised by pyglet's xlib canvas, which can't be imported to catch it by class
+    if type(error).__name__ != 'NoSuchDisplayException':
+        raise
+    pyglet_error = error
+if pyglet_error:
+    pyglet = None
+try:
+    import numpy
+except ImportError:
+    # optional, only needed for the array backed MeteorStore
+    numpy = None
 
 # float comparison courtesy of stack overflow
 # http://stackoverflow.com/questions/10334688/how-dangerous-is-it-to-compare-floating-point-values
@@ -23,8 +47,23 @@ TURN = enum('left', 'right')
 THRUST = enum('forward', 'back')
 STATE = enum('start', 'play', 'game_over', 'level')
 
-class Vector2():
+if pyglet is None:
+    # the keys the game listens for, with the same codes as pyglet.window.key
+    key = enum(ENTER = 0xff0d, LEFT = 0xff51, UP = 0xff52, RIGHT = 0xff53, DOWN = 0xff54,
+               SPACE = 0x020, A = 0x061, P = 0x070, S = 0x073)
+
+# the clock with the best resolution there is
+if hasattr(time, 'perf_counter'):
+    clock = time.perf_counter
+else:
+    clock = time.time
+
+class Vector2(object):
     # 2D vector/point
+    # The in-place operators (+=, -=, *=, /=) and add_scaled() modify the vector
+    #  instead of allocating a new one, so only use them on vectors nothing else holds on to.
+    __slots__ = ('x', 'y')
+
     def __init__(self, x, y):
         self.x = x
         self.y = y
@@ -47,6 +86,41 @@ class Vector2():
     def __div__(self, scalar):
         return Vector2(self.x / scalar, self.y / scalar)
 
+    __truediv__ = __div__
+
+    def __iadd__(self, v2):
+        self.x = self.x + v2.x
+        self.y = self.y + v2.y
+        return self
+
+    def __isub__(self, v2):
+        self.x = self.x - v2.x
+        self.y = self.y - v2.y
+        return self
+
+    def __imul__(self, scalar):
+        self.x = self.x * scalar
+        self.y = self.y * scalar
+        return self
+
+    def __idiv__(self, scalar):
+        self.x = self.x / scalar
+        self.y = self.y / scalar
+        return self
+
+    __itruediv__ = __idiv__
+
+    def add_scaled(self, v2, scalar):
+        # self += v2 * scalar, without the temporary vector
+        self.x = self.x + v2.x * scalar
+        self.y = self.y + v2.y * scalar
+        return self
+
+    def set(self, x, y):
+        self.x = x
+        self.y = y
+        return self
+
     def update(self, v2):
         # use this instead of assignment to update a vector in place
         self.x = v2.x
@@ -66,6 +140,12 @@ class Vector2():
         denom = math.sqrt(abs(self))
         return Vector2(self.x / denom, self.y / denom)
 
+    def normalize_in_place(self):
+        denom = math.sqrt(abs(self))
+        self.x = self.x / denom
+        self.y = self.y / denom
+        return self
+
 
 class Line():
     # line segment helper. start and end are Vector2
@@ -130,6 +210,115 @@ class Line():
             return False
 
 
+def near_array(f1, f2, k = 1):
+    # near() for numpy arrays, elementwise
+    diff = numpy.abs(f1 - f2)
+    return (diff < k * FL_EPS * numpy.abs(f1 + f2)) | (diff < FL_MIN)
+
+
+def intersect_segments(starts, ends, edge_starts, edge_ends):
+    # Line.intersect for many line segments at once (requires numpy).
+    # starts/ends are (m, 2) arrays holding the m segments to test, and
+    #  edge_starts/edge_ends (e, 2) arrays holding the e segments to test them against,
+    #  like the edges of a meteor (or of many meteors, stacked).
+    # Returns an (m, e) array of hit flags, and an (m, 2) array with the first point
+    #  along each segment where it hits an edge (nan if it doesn't hit any).
+    # Zero length segments and parallel lines behave as in Line.
+    (starts, ends, edge_starts, edge_ends) = [
+        numpy.asarray(a, dtype = float) for a in (starts, ends, edge_starts, edge_ends)]
+    (starts, ends) = _nudge_degenerate(starts, ends)
+    (edge_starts, edge_ends) = _nudge_degenerate(edge_starts, edge_ends)
+    # A, B, C of each line as in Line.get_abc, shaped to broadcast to (m, e)
+    a1 = (ends[:, 1] - starts[:, 1])[:, None]
+    b1 = (starts[:, 0] - ends[:, 0])[:, None]
+    c1 = a1 * starts[:, 0][:, None] + b1 * starts[:, 1][:, None]
+    a2 = (edge_ends[:, 1] - edge_starts[:, 1])[None, :]
+    b2 = (edge_starts[:, 0] - edge_ends[:, 0])[None, :]
+    c2 = a2 * edge_starts[:, 0][None, :] + b2 * edge_starts[:, 1][None, :]
+    det = a1 * b2 - a2 * b1
+    parallel = det == 0
+    det = numpy.where(parallel, 1, det)
+    x = (b2 * c1 - b1 * c2) / det
+    y = (a1 * c2 - a2 * c1) / det
+    hits = ~parallel
+    hits &= _within(starts[:, None, :], ends[:, None, :], x, y)
+    hits &= _within(edge_starts[None, :, :], edge_ends[None, :, :], x, y)
+    # first contact is the hit closest to the start of the segment
+    dist = (x - starts[:, 0][:, None]) ** 2 + (y - starts[:, 1][:, None]) ** 2
+    dist = numpy.where(hits, dist, numpy.inf)
+    contact = numpy.full((len(starts), 2), numpy.nan)
+    if dist.shape[1]:
+        first = numpy.argmin(dist, axis = 1)
+        rows = numpy.arange(len(starts))
+        hit_any = hits[rows, first]
+        contact[hit_any, 0] = x[rows, first][hit_any]
+        contact[hit_any, 1] = y[rows, first][hit_any]
+    return (hits, contact)
+
+
+def sweep_circles(starts, ends, centers, radius):
+    # BoundingCircle.sweep for many segments and circles at once (requires numpy).
+    # starts/ends and centers are arrays of points (..., 2), and radius an array
+    #  (...), all broadcast against each other. Returns which segments touch their
+    #  circle, starting inside it counts.
+    d = ends - starts
+    f = starts - centers
+    a = (d ** 2).sum(axis = -1)
+    b = (f * d).sum(axis = -1)
+    c = (f ** 2).sum(axis = -1) - radius ** 2
+    disc = b * b - a * c
+    t = (-b - numpy.sqrt(numpy.maximum(disc, 0))) / numpy.where(a > 0, a, 1)
+    return (c <= 0) | ((a > 0) & (b < 0) & (disc >= 0) & (t <= 1))
+
+
+def sweep_outlines(p, q, edge_starts, edge_ends, inside = True):
+    # MeteorShape.sweep for many segments at once, each against its own outline
+    #  (requires numpy).
+    # p/q are (k, 2) arrays with the segments in the unit space of their outlines
+    #  (Meteor.to_local), and edge_starts/edge_ends (k, e, 2) arrays with the edges of
+    #  each outline, padded with nan (which never hit) to the same count.
+    # Returns a (k,) array of how far along each segment it first touches its
+    #  outline (inf if it doesn't). Segments starting inside touch it at 0
+    #  (MeteorShape.contains), unless inside is false.
+    (es, ee) = (edge_starts, edge_ends)
+    r = (q - p)[:, None, :]
+    s = ee - es
+    w = es - p[:, None, :]
+    with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+        det = r[:, :, 0] * s[:, :, 1] - r[:, :, 1] * s[:, :, 0]
+        t = (w[:, :, 0] * s[:, :, 1] - w[:, :, 1] * s[:, :, 0]) / det
+        u = (w[:, :, 0] * r[:, :, 1] - w[:, :, 1] * r[:, :, 0]) / det
+        hit = (det != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+        time = numpy.where(hit, t, numpy.inf).min(axis = 1)
+        if not inside:
+            return time
+        # even-odd test of the starts against the outlines
+        py = p[:, 1][:, None]
+        crosses = (es[:, :, 1] > py) != (ee[:, :, 1] > py)
+        x = es[:, :, 0] + (py - es[:, :, 1]) * s[:, :, 0] / s[:, :, 1]
+        starts_inside = (crosses & (p[:, 0][:, None] < x)).sum(axis = 1) % 2 == 1
+    return numpy.where(starts_inside, 0.0, time)
+
+
+def _nudge_degenerate(starts, ends):
+    # fake a short line where start and end are the same, as Line.__init__ does
+    same = (starts[:, 0] == ends[:, 0]) & (starts[:, 1] == ends[:, 1])
+    if same.any():
+        starts = starts.copy()
+        starts[same] += 0.1
+    return (starts, ends)
+
+
+def _within(start, end, x, y):
+    # Line.within for arrays of points (x, y) and segments (start, end)
+    (sx, sy, ex, ey) = (start[..., 0], start[..., 1], end[..., 0], end[..., 1])
+    c1 = numpy.where(near_array(sx, ex), near_array(x, sx),
+                     (x < numpy.maximum(sx, ex)) & (x > numpy.minimum(sx, ex)))
+    c2 = numpy.where(near_array(sy, ey), near_array(y, sy),
+                     (y < numpy.maximum(sy, ey)) & (y > numpy.minimum(sy, ey)))
+    return c1 & c2
+
+
 class BoundingCircle():
     # bounding circle helper
     def __init__(self, center, radius):
@@ -138,15 +327,147 @@ class BoundingCircle():
 
     def inside(self, point):
         # returns true if the point is inside the circle
-        return abs(point - self.center) < (self.radius * self.radius)
-
-
-class WObject():
+        dx = point.x - self.center.x
+        dy = point.y - self.center.y
+        return (dx * dx + dy * dy) < (self.radius * self.radius)
+
+    def overlaps(self, circle):
+        # returns true if the two circles overlap (or touch)
+        radii = self.radius + circle.radius
+        return abs(circle.center - self.center) <= (radii * radii)
+
+    def enclose(self, circle):
+        # returns the smallest circle containing both circles
+        dist = math.sqrt(abs(circle.center - self.center))
+        if dist + circle.radius <= self.radius:
+            return self
+        if dist + self.radius <= circle.radius:
+            return circle
+        radius = (dist + self.radius + circle.radius) / 2
+        center = self.center + (circle.center - self.center) * ((radius - self.radius) / dist)
+        return BoundingCircle(center, radius)
+
+    def sweep(self, start, end):
+        # returns how far along the segment from start to end (0 to 1) it first
+        #  touches the circle, or None if it doesn't
+        (dx, dy) = (end.x - start.x, end.y - start.y)
+        (fx, fy) = (start.x - self.center.x, start.y - self.center.y)
+        c = fx * fx + fy * fy - self.radius * self.radius
+        if c <= 0:
+            return 0.0
+        a = dx * dx + dy * dy
+        b = fx * dx + fy * dy
+        if a == 0 or b >= 0:
+            # not moving, or moving away
+            return None
+        disc = b * b - a * c
+        if disc < 0:
+            return None
+        t = (-b - math.sqrt(disc)) / a
+        if t > 1:
+            return None
+        return t
+
+
+class SpatialHash():
+    # Uniform grid broadphase for collision detection.
+    # Objects are bucketed into every cell their bounding circle touches, and query()
+    #  returns the objects whose circles overlap a given circle. Cell coordinates wrap
+    #  around the world the same way objects do, so the grid stays the size of the
+    #  world even for objects hanging off its edges.
+    def __init__(self, cell_size):
+        self.cell_size = float(cell_size)
+        self.clear(WorldBounds(cell_size, cell_size))
+
+    def clear(self, bounds):
+        # empty the grid and size it to cover bounds (a window or WorldBounds)
+        (winx, winy) = bounds.get_size()
+        self.cols = max(1, int(math.ceil(winx / self.cell_size)))
+        self.rows = max(1, int(math.ceil(winy / self.cell_size)))
+        self.cells = dict()
+        self.objects = []
+        self.circles = []
+
+    def insert(self, obj, circle):
+        index = len(self.objects)
+        self.objects.append(obj)
+        self.circles.append(circle)
+        (x0, x1) = self._span(circle.center.x, circle.radius, self.cols)
+        (y0, y1) = self._span(circle.center.y, circle.radius, self.rows)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                cell = (x % self.cols, y % self.rows)
+                if cell in self.cells:
+                    self.cells[cell].append(index)
+                else:
+                    self.cells[cell] = [index]
+
+    def query(self, circle):
+        # returns the objects whose bounding circles overlap circle, in the order
+        #  they were inserted
+        (x0, x1) = self._span(circle.center.x, circle.radius, self.cols)
+        (y0, y1) = self._span(circle.center.y, circle.radius, self.rows)
+        candidates = set()
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                candidates.update(self.cells.get((x % self.cols, y % self.rows), ()))
+        found = []
+        for i in sorted(candidates):
+            if self.circles[i].overlaps(circle):
+                found.append(self.objects[i])
+        return found
+
+    def _span(self, center, radius, count):
+        # first and last cell covered by center +/- radius along one axis.
+        # an object can cover a cell at most once, even if it's bigger than the world
+        first = int(math.floor((center - radius) / self.cell_size))
+        last = int(math.floor((center + radius) / self.cell_size))
+        if last - first >= count:
+            last = first + count - 1
+        return (first, last)
+
+
+class WorldBounds():
+    # the size of the world when there is no window to take it from.
+    # objects only ever ask for get_size(), so a window works in place of this too
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+    def get_size(self):
+        return (self.width, self.height)
+
+
+class History():
+    # Fixed size ring buffer of past values, most recent first (history[0] is the
+    #  value from one update ago). push() is O(1) and drops the oldest value.
+    def __init__(self, size, value):
+        self.values = [value] * size
+        self.head = 0
+
+    def push(self, value):
+        if self.values:
+            self.head = (self.head - 1) % len(self.values)
+            self.values[self.head] = value
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if index >= len(self.values) or index < -len(self.values):
+            raise IndexError('history index out of range')
+        return self.values[(self.head + index) % len(self.values)]
+
+
+class WObject(object):
     # Represents a game/world object. Handles it's own rendering, and updating.
     # Game objects should subclass this one. Contains some helper functions as well.
+
+    # how many past pos/deg to keep track of. only objects that read them
+    #  (e.g. for swept collision detection) need any
+    state_buffer = 0
+
     def __init__(self):
-        # how many past pos/deg to keep track of
-        self.state_buffer = 5 
         # position (x,y) (x > 0 => right, y > 0 => up)
         self.init_pos(Vector2(0, 0))
         # angular position in degrees. 0 = up, 90 = left
@@ -157,15 +478,16 @@ class WObject():
         self.size = Vector2(1, 1)
         # flag to mark object for removal
         self.remove = False
+        # index in the EntityStore holding the object (None when it's not in one)
+        self.slot = None
+        # how many update cycles back collision detection looks (see broadphase_circle)
+        self.sweep = 0
         
         # Define the shape. Place all vertexes within the unit square as defined below.
         #  Use size to then size it appropriately. Points should always be in groups of
         #  2 vectors. To connect lines, you must define the connecting
         #  vertices twice.
-        self.points = self.to_points([0, 0, 0, 1, 
-                                      0, 1, 1, 1, 
-                                      1, 1, 1, 0, 
-                                      1, 0, 0, 0]) # square
+        self.points = self.shape('square')
 
         # where within the unit square should the position be defined.
         # it is also the point about which the object will rotate
@@ -174,102 +496,238 @@ class WObject():
         # color in RGB
         self.color = [1, 1, 1]
 
-        # debug stuff
-        self.box = self.points 
-        self.circle = self.generate_circle(48)
-        self.cross = self.to_points([0, 0.5, 1, 0.5, 0.5, 0, 0.5, 1])
-        self.draw_box = False # shows the unit box around the object
-        self.draw_circle = False # shows the unit circle around the object
-        self.draw_cross = False # shows a unit cross centered on object
-        self.draw_transform = False # draw the points transformed in cpu space
-        self.draw_pos_change = False # draws the positional change between two frames as a line
+    # debug stuff. turn these on per object. the shapes they draw are only built
+    #  once something needs them, and are then shared by all objects
+    draw_box = False # shows the unit box around the object
+    draw_circle = False # shows the unit circle around the object
+    draw_cross = False # shows a unit cross centered on object
+    draw_transform = False # draw the points transformed in cpu space
+    draw_pos_change = False # draws the positional change between two frames as a line
+
+    box = property(lambda self: self.shape('square'))
+    circle = property(lambda self: self.shape('circle'))
+    cross = property(lambda self: self.shape('cross'))
+
+    # name => unit space points, shared by all objects (they must not be modified)
+    shapes = dict()
+
+    def shape(self, name):
+        # returns one of the standard shapes, building it the first time it's asked for
+        if name not in WObject.shapes:
+            if name == 'square':
+                WObject.shapes[name] = self.to_points([0, 0, 0, 1,
+                                                       0, 1, 1, 1,
+                                                       1, 1, 1, 0,
+                                                       1, 0, 0, 0])
+            elif name == 'circle':
+                WObject.shapes[name] = self.generate_circle(48)
+            elif name == 'cross':
+                WObject.shapes[name] = self.to_points([0, 0.5, 1, 0.5, 0.5, 0, 0.5, 1])
+        return WObject.shapes[name]
 
     def to_points(self, p_list):
         # converts flat list of floats to list of Vector2
         points = []
-        for i in range(len(p_list) / 2):
+        for i in range(len(p_list) // 2):
             x = p_list[i * 2]
             y = p_list[i * 2 + 1]
             points.append(Vector2(x, y))
         return points
 
+    # Transformed geometry is cached until the object moves, turns or changes shape
+    #  (see invalidate()), so it's computed at most once per update cycle no matter
+    #  how many collision tests read it. The cached lists must not be modified.
+
+    def invalidate(self):
+        # forget the cached world space geometry
+        self._cache = dict()
+
+    def _geometry(self):
+        # the cache of world space geometry for the current state
+        return self._cache
+
     def get_point_transformed(self, index, num = 0):
         # returns the point at index from by self.points but after
         #  translation/rotation/scaling via cpu. 
         # if num > 0, will return the points generated from an older state
-        num = num % self.state_buffer
-        point = self.points[index]
-        # center on anchor
-        point = point - self.anchor
-        # scale
-        point.x = point.x * self.size.x
-        point.y = point.y * self.size.y
-        # rotate
-        if num > 0:
-            deg = self.last_deg[num - 1]
-        else:
-            deg = self.deg
-        sin = math.sin(math.radians(deg))
-        cos = math.cos(math.radians(deg))
-        x = point.x * cos - point.y * sin
-        y = point.x * sin + point.y * cos
-        point.y = y
-        point.x = x
-        # translate
-        if num > 0:
-            pos = self.last_pos[num - 1]
-        else:
-            pos = self.pos
-        point = point + pos
-        return point
+        return self.get_all_points_transformed(num)[index].copy()
 
     def get_all_points_transformed(self, num = 0):
-        # returns all transformed points. maybe slow for many points
+        # returns all transformed points
+        num = self._frame(num)
+        cache = self._geometry()
+        if ('points', num) not in cache:
+            cache[('points', num)] = self._transform_points(*self._transform(num))
+        return cache[('points', num)]
+
+    def _transform_points(self, pos, sin, cos):
+        # self.points placed at pos, rotated by the angle with the given sin and cos
+        (ax, ay, sx, sy) = (self.anchor.x, self.anchor.y, self.size.x, self.size.y)
         points = []
-        for i in range(len(self.points)):
-            points.append(self.get_point_transformed(i, num))
+        for point in self.points:
+            # center on anchor and scale
+            x = (point.x - ax) * sx
+            y = (point.y - ay) * sy
+            # rotate and translate
+            points.append(Vector2((x * cos - y * sin) + pos.x, (x * sin + y * cos) + pos.y))
         return points
 
+    def get_point_array(self, num = 0):
+        # get_all_points_transformed() as an (n, 2) numpy array
+        num = self._frame(num)
+        cache = self._geometry()
+        if ('array', num) not in cache:
+            (pos, sin, cos) = self._transform(num)
+            local = numpy.array([(point.x, point.y) for point in self.points], dtype = float)
+            local = local.reshape((len(self.points), 2))
+            x = (local[:, 0] - self.anchor.x) * self.size.x
+            y = (local[:, 1] - self.anchor.y) * self.size.y
+            world = numpy.empty_like(local)
+            world[:, 0] = (x * cos - y * sin) + pos.x
+            world[:, 1] = (x * sin + y * cos) + pos.y
+            cache[('array', num)] = world
+        return cache[('array', num)]
+
+    def get_edge_arrays(self):
+        # get_lines() as two (n, 2) numpy arrays of start and end points
+        points = self.get_point_array()
+        return (points[0::2], points[1::2])
+
     def get_lines(self):
         # returns a list of all line segments defined by points after transformation.
-        lines = []
-        for i in range(len(self.points) / 2):
-            p1 = self.get_point_transformed(i * 2)
-            p2 = self.get_point_transformed(i * 2 + 1)
-            lines.append(Line(p1, p2))
-        return lines
+        cache = self._geometry()
+        if 'lines' not in cache:
+            points = self.get_all_points_transformed()
+            lines = []
+            for i in range(len(points) // 2):
+                # copies, since Line can move its start point
+                lines.append(Line(points[i * 2].copy(), points[i * 2 + 1].copy()))
+            cache['lines'] = lines
+        return cache['lines']
+
+    def _transform(self, num):
+        # position, and sin and cos of the angle, num update cycles ago
+        if num > 0:
+            (pos, deg) = (self.last_pos[num - 1], self.last_deg[num - 1])
+        else:
+            (pos, deg) = (self.pos, self.deg)
+        rad = math.radians(deg)
+        return (pos, math.sin(rad), math.cos(rad))
+
+    def _get_size(self):
+        return self._size
+
+    def _set_size(self, size):
+        self._size = size
+        self.invalidate()
+
+    size = property(_get_size, _set_size)
+
+    def _get_anchor(self):
+        return self._anchor
+
+    def _set_anchor(self, anchor):
+        self._anchor = anchor
+        self.invalidate()
+
+    anchor = property(_get_anchor, _set_anchor)
+
+    def _get_points(self):
+        return self._points
+
+    def _set_points(self, points):
+        self._points = points
+        self.invalidate()
+
+    points = property(_get_points, _set_points)
+
+    def bounding_circle(self):
+        # circle around the position that contains the object at any rotation
+        radius = 0
+        for corner in [Vector2(0, 0), Vector2(0, 1), Vector2(1, 0), Vector2(1, 1)]:
+            offset = corner - self.anchor
+            offset.x = offset.x * self.size.x
+            offset.y = offset.y * self.size.y
+            radius = max(radius, abs(offset))
+        return BoundingCircle(self.pos, math.sqrt(radius))
+
+    def broadphase_circle(self):
+        # bounding circle that also covers where the object was self.sweep
+        #  update cycles ago, since collision detection tests that path
+        circle = self.bounding_circle()
+        if self.sweep > 0:
+            old = BoundingCircle(self.last_pos[self.sweep - 1], circle.radius)
+            circle = circle.enclose(old)
+        return circle
 
     def init_pos(self, pos):
-        # initialize position vector
-        self.pos = pos
-        self.last_pos = []
-        for i in range(self.state_buffer):
-            self.last_pos.append(pos)
+        # initialize position vector. takes a copy, since the position
+        #  is updated in place where possible (see _next_pos)
+        self.pos = pos.copy()
+        self.invalidate()
+        self.last_pos = History(self.state_buffer, pos)
 
     def update_pos(self, pos):
         # update the position vector
-        self.last_pos.insert(0, self.pos)
-        self.last_pos.pop()
+        self.last_pos.push(self.pos)
         self.pos = pos
+        self.invalidate()
 
     def init_deg(self, deg):
         # initialize degrees member
         self.deg = deg
-        self.last_deg = []
-        for i in range(self.state_buffer):
-            self.last_deg.append(deg)
+        self.invalidate()
+        self.last_deg = History(self.state_buffer, deg)
 
     def update_deg(self, deg):
         # update the degrees member
-        self.last_deg.insert(0, self.deg)
-        self.last_deg.pop()
+        self.last_deg.push(self.deg)
         self.deg = deg
+        self.invalidate()
+
+    def _next_pos(self):
+        # a vector to build the next position in. that's the current position, unless
+        #  the history still needs it
+        if self.state_buffer:
+            return self.pos.copy()
+        return self.pos
+
+    def previous_state(self):
+        # position and angle as of one update ago, or None if that isn't kept
+        if self.state_buffer:
+            return (self.last_pos[0], self.last_deg[0])
+        return None
+
+    def interpolated_state(self, alpha, bounds):
+        # position and angle alpha of the way from the previous update to the current one.
+        # an object that jumped to the other side of the world is just where it is now
+        previous = self.previous_state()
+        if previous == None:
+            return (self.pos, self.deg)
+        (old_pos, old_deg) = previous
+        dx = self.pos.x - old_pos.x
+        dy = self.pos.y - old_pos.y
+        (winx, winy) = bounds.get_size()
+        if abs(dx) > winx / 2 or abs(dy) > winy / 2:
+            return (self.pos, self.deg)
+        # turn the short way round, angles may have been wrapped to 0-360
+        turn = (self.deg - old_deg + 180) % 360 - 180
+        return (Vector2(old_pos.x + dx * alpha, old_pos.y + dy * alpha), old_deg + turn * alpha)
 
     def get_pos_change(self, num):
-        # the positional change from num update cycles ago (where num < self.state_buffer)
-        num = num % self.state_buffer
+        # the positional change from num update cycles ago (where num < self.state_buffer).
+        #  without any history, the object hasn't moved
+        if not self.state_buffer:
+            return Vector2(0, 0)
+        num = self._frame(num)
         return self.pos - self.last_pos[num]
 
+    def _frame(self, num):
+        # wraps num to the history that's kept. without any, there is only the present
+        if self.state_buffer:
+            return num % self.state_buffer
+        return 0
+
     def generate_circle(self, num_points):
         # generates a unit circle with num_points
         interval = 360.0 / num_points
@@ -286,7 +744,8 @@ class WObject():
         points.append(first)
         return points
 
-    def deg_to_vel(self, deg):
+    @staticmethod
+    def deg_to_vel(deg):
         # convert degrees (up => 0, left => 90) 
         #  to a normalized vector (top|right => y|x > 0)
         y = abs(math.tan(math.radians(deg-90)))
@@ -295,7 +754,7 @@ class WObject():
             x = -1
         if deg > 90 and deg < 270:
             y = -y
-        return Vector2(x, y).normalize()
+        return Vector2(x, y).normalize_in_place()
 
     def draw_points(self, points):
         # draws the set of point pairs as GL_LINES
@@ -306,12 +765,13 @@ class WObject():
         pyglet.graphics.draw(len(points), GL_LINES, ('v2f', the_points))
 
     def draw(self):
-        # simple scale/rotate/tranlate and color of gl lines
+        # simple scale/rotate/tranlate and color of gl lines (immediate mode).
+        # the game draws through a batch instead (see attach), and only uses this
+        #  for the debug overlays
         glLoadIdentity()
-        if self.draw_pos_change:
+        if self.draw_pos_change and self.state_buffer:
             glColor3f(1, 1, 0)
-            points = [self.last_pos.x, self.last_pos.y, self.pos.x, self.pos.y]
-            self.draw_points(points)
+            self.draw_points([self.last_pos[0], self.pos])
         if self.draw_transform:
             points = self.get_all_points_transformed()
             glColor3f(0, 0, 1)
@@ -329,9 +789,85 @@ class WObject():
         if self.draw_cross:
             self.draw_points(self.cross)
 
+    def debugging(self):
+        # returns true if any of the debug overlays are turned on
+        return (self.draw_box or self.draw_circle or self.draw_cross or
+                self.draw_transform or self.draw_pos_change)
+
+    # Retained rendering. An object attached to a pyglet Batch keeps its transformed
+    #  lines in a vertex list of that batch. sync_vertices() rewrites them only when
+    #  the object moved, changed shape or changed color, and the whole batch is then
+    #  drawn with one call.
+
+    batch = None
+    vertex_list = None
+    _synced_geometry = None
+    _synced_look = None
+
+    def attach(self, batch):
+        self.detach()
+        self.batch = batch
+        self.sync_vertices()
+
+    def detach(self):
+        if self.vertex_list:
+            self.vertex_list.delete()
+        self.batch = None
+        self.vertex_list = None
+        self._synced_geometry = None
+        self._synced_look = None
+
+    def sync_vertices(self, alpha = 1, bounds = None):
+        # alpha < 1 draws the object that far between its previous and current
+        #  state (see interpolated_state), which needs bounds
+        if not self.batch:
+            return
+        if self.previous_state() == None:
+            alpha = 1
+        geometry = self._geometry()
+        color = tuple(self.color)
+        look = (color, alpha)
+        if geometry is self._synced_geometry and look == self._synced_look:
+            return
+        self._synced_geometry = geometry
+        self._synced_look = look
+        if alpha == 1:
+            points = self.get_all_points_transformed()
+        else:
+            (pos, deg) = self.interpolated_state(alpha, bounds)
+            rad = math.radians(deg)
+            points = self._transform_points(pos, math.sin(rad), math.cos(rad))
+        count = len(points)
+        if self.vertex_list and self.vertex_list.get_size() != count:
+            self.vertex_list.delete()
+            self.vertex_list = None
+        if count == 0:
+            return
+        if not self.vertex_list:
+            self.vertex_list = self.batch.add(count, GL_LINES, None, 'v2f/stream', 'c3f/stream')
+        vertices = []
+        for point in points:
+            vertices.append(point.x)
+            vertices.append(point.y)
+        self.vertex_list.vertices[:] = vertices
+        self.vertex_list.colors[:] = color * count
+
 
 class Font(WObject):
     # drawable text object
+    # The glyphs are compiled once and shared by all fonts. Laid out strings are cached
+    #  by their text and layout options, and so is each glyph placed at a given offset,
+    #  so changing a string only places the characters that weren't there before.
+
+    # char => glyph as a flat tuple of x, y pairs, compiled from char_points on first use
+    glyphs = None
+    # (string, spacing, just-x, just-y) => points of the laid out string
+    layouts = dict()
+    # (char, x offset, y offset) => points of the glyph placed at that offset
+    glyph_runs = dict()
+    # how many layouts or glyph runs to cache before starting over
+    cache_limit = 1024
+
     def __init__(self, pos, size, opts = {}):
         WObject.__init__(self)
         self.anchor = Vector2(0, 0)
@@ -345,171 +881,395 @@ class Font(WObject):
         self.opts.update(opts)
         self.string = ""
         self.did_update_string = True
-        self._init_char_points()
+        if Font.glyphs == None:
+            Font._compile_glyphs()
 
     def set_string(self, string):
         # set the string to display
         self.string = string
         self.did_update_string = True
 
-    def update(self, time, window):
+    def update(self, time, bounds):
         if self.did_update_string:
             self.did_update_string = False
             self.points = self._string_to_points(self.string)
 
     def _string_to_points(self, string):
-        points = []
-        index = 0
-        for char in string:
-            points = points + self._char_to_points(char, index)
-            index += 1
-        return points
-
-    def _char_to_points(self, char, index):
-        if char in self.char_points:
-            points = self.to_points(self.char_points[char])
-        else:
+        layout = (string, self.opts['spacing'], self.opts['just-x'], self.opts['just-y'])
+        if layout not in Font.layouts:
+            if len(Font.layouts) >= Font.cache_limit:
+                Font.layouts.clear()
             points = []
-        extra = self._find_extra(index)
-        for point in points:
-            point.update(point + extra)
-        return points
+            width = self._find_width(string)
+            for index in range(len(string)):
+                points.extend(self._char_to_points(string[index], self._find_extra(index, width)))
+            Font.layouts[layout] = points
+        return Font.layouts[layout]
+
+    def _char_to_points(self, char, extra):
+        run = (char, extra.x, extra.y)
+        if run not in Font.glyph_runs:
+            if len(Font.glyph_runs) >= Font.cache_limit:
+                Font.glyph_runs.clear()
+            glyph = Font.glyphs.get(char, ())
+            points = []
+            for i in range(0, len(glyph), 2):
+                points.append(Vector2(glyph[i] + extra.x, glyph[i + 1] + extra.y))
+            Font.glyph_runs[run] = points
+        return Font.glyph_runs[run]
 
-    def _find_extra(self, index):
+    def _find_extra(self, index, width):
         extra = Vector2(0, 0)
         extra.x = (1 + self.opts['spacing']) * index
         if self.opts['just-x'] == 'center':
-            extra.x = extra.x - self._find_width() / 2
+            extra.x = extra.x - width / 2
         if self.opts['just-x'] == 'right':
-            extra.x = extra.x - self._find_width()
+            extra.x = extra.x - width
         if self.opts['just-y'] == 'center':
             extra.y = extra.y - self._find_height() / 2
         if self.opts['just-y'] == 'top':
             extra.y = extra.y - self._find_height()
         return extra
 
-    def _find_width(self):
-        length = len(self.string)
+    def _find_width(self, string):
+        length = len(string)
         return length + self.opts['spacing'] * (length - 1)
 
     def _find_height(self):
         return 1
 
-    def _init_char_points(self):
-        # oh god why
-        self.char_points = {
-            'A': [0, 0, 0.5, 1, 0.5, 1, 1, 0, 0.25, 0.5, 0.75, 0.5],
-            'B': [0, 0, 0, 1, 0, 1, 0.75, 1, 0.75, 1, 1, 0.75, 1, 0.75, 0.75, 0.5, 0.75, 
-                    0.5, 1, 0.25, 1, 0.25, 0.75, 0, 0.75, 0, 0, 0, 0, 0.5, 0.75, 0.5],
-            'C': [1, 0.25, 0.75, 0, 0.75, 0, 0.25, 0, 0.25, 0, 0, 0.25, 0, 0.25, 0, 
-                    0.75, 0, 0.75, 0.25, 1, 0.25, 1, 0.75, 1, 0.75, 1, 1, 0.75],
-            'D': [0, 0, 0, 1, 0, 1, 0.75, 1, 0.75, 1, 1, 0.75, 1, 0.75, 1, 0.25, 
-                    1, 0.25, 0.75, 0, 0.75, 0, 0, 0],
-            'E': [0, 1, 1, 1, 0, 0.5, 0.75, 0.5, 0, 0, 1, 0, 0, 0, 0, 1],
-            'F': [0, 0, 0, 1, 0, 1, 1, 1, 0, 0.5, 0.75, 0.5],
-            'G': [1, 0.75, 0.75, 1, 0.75, 1, 0.25, 1, 0.25, 1, 0, 0.75, 0, 0.75, 0, 0.25, 0, 0.25, 
-                    0.25, 0, 0.25, 0, 0.75, 0, 0.75, 0, 1, 0.25, 1, 0.25, 1, 0.5, 1, 0.5, 0.5, 0.5],
-            'H': [0, 0, 0, 1, 1, 0, 1, 1, 0, 0.5, 1, 0.5],
-            'I': [0.25, 1, 0.75, 1, 0.25, 0, 0.75, 0, 0.5, 0, 0.5, 1],
-            'J': [0, 0, 0.5, 0, 0.5, 0, 0.5, 1, 0, 1, 1, 1],
-            'K': [0, 0, 0, 1, 0, 0.5, 1, 1, 0, 0.5, 1, 0],
-            'L': [0, 0, 0, 1, 0, 0, 1, 0],
-            'M': [0, 0, 0, 1, 0, 1, 0.5, 0.5, 0.5, 0.5, 1, 1, 1, 1, 1, 0],
-            'N': [0, 0, 0, 1, 0, 1, 1, 0, 1, 0, 1, 1],
-            'O': [1, 0.75, 0.75, 1, 0.75, 1, 0.25, 1, 0.25, 1, 0, 0.75, 0, 0.75, 0, 0.25, 0, 0.25, 
-                    0.25, 0, 0.25, 0, 0.75, 0, 0.75, 0, 1, 0.25, 1, 0.25, 1, 0.75],
-            'P': [0, 0, 0, 1, 0, 1, 0.75, 1, 0.75, 1, 1, 0.75, 1, 0.75, 0.75, 0.5, 0.75, 0.5, 0, 0.5],
-            'Q': [1, 0.75, 0.75, 1, 0.75, 1, 0.25, 1, 0.25, 1, 0, 0.75, 0, 0.75, 0, 0.25, 0, 0.25, 
-                    0.25, 0, 0.25, 0, 0.75, 0, 0.75, 0, 1, 0.25, 1, 0.25, 1, 0.75, 0.75, 0.25, 1, 0],
-            'R': [0, 0, 0, 1, 0, 1, 0.75, 1, 0.75, 1, 1, 0.75, 1, 0.75, 0.75, 0.5, 
-                    0.75, 0.5, 0, 0.5, 0.75, 0.5, 1, 0],
-            'S': [0, 0.25, 0.25, 0, 0.25, 0, 0.75, 0, 0.75, 0, 1, 0.25, 1, 0.25, 0.75, 0.5, 0.75, 0.5, 
-                    0.25, 0.5, 0.25, 0.5, 0, 0.75, 0, 0.75, 0.25, 1, 0.25, 1, 0.75, 1, 0.75, 1, 1, 0.75],
-            'T': [0, 1, 1, 1, 0.5, 1, 0.5, 0],
-            'U': [0, 1, 0, 0.25, 0, 0.25, 0.25, 0, 0.25, 0, 0.75, 0, 0.75, 0, 1, 0.25, 1, 0.25, 1, 1],
-            'V': [0, 1, 0.5, 0, 0.5, 0, 1, 1],
-            'W': [0, 1, 0, 0, 0, 0, 0.5, 0.5, 0.5, 0.5, 1, 0, 1, 0, 1, 1],
-            'X': [0, 0, 1, 1, 1, 0, 0, 1],
-            'Y': [0, 1, 0.5, 0.5, 0.5, 0.5, 1, 1, 0.5, 0.5, 0.5, 0],
-            'Z': [0, 1, 1, 1, 1, 1, 0, 0, 0, 0, 1, 0],
-            '1': [0, 0.75, 0.5, 1, 0.5, 1, 0.5, 0, 0, 0, 1, 0],
-            '2': [1, 0, 0, 0, 0, 0, 0.75, 0.5, 0.75, 0.5, 1, 0.75, 1, 0.75, 0.75, 
-                    1, 0.75, 1, 0.25, 1, 0.25, 1, 0, 0.75],
-            '3': [0, 0.75, 0.25, 1, 0.25, 1, 0.75, 1, 0.75, 1, 1, 0.75, 1, 0.75, 0.75, 0.5, 0.75, 
-                    0.5, 1, 0.25, 1, 0.25, 0.75, 0, 0.75, 0, 0.25, 0, 0.25, 0, 0, 0.25, 0.25, 0.5, 0.75, 0.5],
-            '4': [0.75, 0, 0.75, 1, 0.75, 1, 0, 0.25, 0, 0.25, 1, 0.25],
-            '5': [1, 1, 0, 1, 0, 1, 0, 0.5, 0, 0.5, 0.75, 0.5, 0.75, 0.5, 1, 0.25, 
-                    1, 0.25, 0.75, 0, 0.75, 0, 0, 0],
-            '6': [1, 0.75, 0.75, 1, 0.75, 1, 0.25, 1, 0.25, 1, 0, 0.75, 0, 0.75, 0, 0.25, 0, 0.25, 0.25, 
-                    0, 0.25, 0, 0.75, 0, 0.75, 0, 1, 0.25, 1, 0.25, 0.75, 0.5, 0.75, 0.5, 0, 0.5],
-            '7': [0, 1, 1, 1, 1, 1, 0.25, 0],
-            '8': [0, 0.75, 0.25, 1, 0.25, 1, 0.75, 1, 0.75, 1, 1, 0.75, 1, 0.75, 0.75, 0.5, 0.75, 
-                    0.5, 1, 0.25, 1, 0.25, 0.75, 0, 0.75, 0, 0.25, 0, 0.25, 0, 0, 0.25, 
-                    0, 0.25, 0.25, 0.5, 0.25, 0.5, 0, 0.75, 0.25, 0.5, 0.75, 0.5],
-            '9': [0, 0.25, 0.25, 0, 0.25, 0, 0.75, 0, 0.75, 0, 1, 0.25, 1, 0.25, 1, 0.75, 1, 0.75, 
-                    0.75, 1, 0.75, 1, 0.25, 1, 0.25, 1, 0, 0.75, 0, 0.75, 0.25, 0.5, 0.25, 0.5, 1, 0.5],
-            '0': [1, 0.75, 0.75, 1, 0.75, 1, 0.25, 1, 0.25, 1, 0, 0.75, 0, 0.75, 0, 0.25, 0, 0.25, 
-                    0.25, 0, 0.25, 0, 0.75, 0, 0.75, 0, 1, 0.25, 1, 0.25, 1, 0.75, 0.75, 1, 0.25, 0],
-        }
+    @classmethod
+    def _compile_glyphs(cls):
+        cls.glyphs = dict()
+        for (char, points) in cls.char_points.items():
+            cls.glyphs[char] = tuple(float(p) for p in points)
+
+    # oh god why
+    char_points = {
+        'A': [0, 0, 0.5, 1, 0.5, 1, 1, 0, 0.25, 0.5, 0.75, 0.5],
+        'B': [0, 0, 0, 1, 0, 1, 0.75, 1, 0.75, 1, 1, 0.75, 1, 0.75, 0.75, 0.5, 0.75, 
+                0.5, 1, 0.25, 1, 0.25, 0.75, 0, 0.75, 0, 0, 0, 0, 0.5, 0.75, 0.5],
+        'C': [1, 0.25, 0.75, 0, 0.75, 0, 0.25, 0, 0.25, 0, 0, 0.25, 0, 0.25, 0, 
+                0.75, 0, 0.75, 0.25, 1, 0.25, 1, 0.75, 1, 0.75, 1, 1, 0.75],
+        'D': [0, 0, 0, 1, 0, 1, 0.75, 1, 0.75, 1, 1, 0.75, 1, 0.75, 1, 0.25, 
+                1, 0.25, 0.75, 0, 0.75, 0, 0, 0],
+        'E': [0, 1, 1, 1, 0, 0.5, 0.75, 0.5, 0, 0, 1, 0, 0, 0, 0, 1],
+        'F': [0, 0, 0, 1, 0, 1, 1, 1, 0, 0.5, 0.75, 0.5],
+        'G': [1, 0.75, 0.75, 1, 0.75, 1, 0.25, 1, 0.25, 1, 0, 0.75, 0, 0.75, 0, 0.25, 0, 0.25, 
+                0.25, 0, 0.25, 0, 0.75, 0, 0.75, 0, 1, 0.25, 1, 0.25, 1, 0.5, 1, 0.5, 0.5, 0.5],
+        'H': [0, 0, 0, 1, 1, 0, 1, 1, 0, 0.5, 1, 0.5],
+        'I': [0.25, 1, 0.75, 1, 0.25, 0, 0.75, 0, 0.5, 0, 0.5, 1],
+        'J': [0, 0, 0.5, 0, 0.5, 0, 0.5, 1, 0, 1, 1, 1],
+        'K': [0, 0, 0, 1, 0, 0.5, 1, 1, 0, 0.5, 1, 0],
+        'L': [0, 0, 0, 1, 0, 0, 1, 0],
+        'M': [0, 0, 0, 1, 0, 1, 0.5, 0.5, 0.5, 0.5, 1, 1, 1, 1, 1, 0],
+        'N': [0, 0, 0, 1, 0, 1, 1, 0, 1, 0, 1, 1],
+        'O': [1, 0.75, 0.75, 1, 0.75, 1, 0.25, 1, 0.25, 1, 0, 0.75, 0, 0.75, 0, 0.25, 0, 0.25, 
+                0.25, 0, 0.25, 0, 0.75, 0, 0.75, 0, 1, 0.25, 1, 0.25, 1, 0.75],
+        'P': [0, 0, 0, 1, 0, 1, 0.75, 1, 0.75, 1, 1, 0.75, 1, 0.75, 0.75, 0.5, 0.75, 0.5, 0, 0.5],
+        'Q': [1, 0.75, 0.75, 1, 0.75, 1, 0.25, 1, 0.25, 1, 0, 0.75, 0, 0.75, 0, 0.25, 0, 0.25, 
+                0.25, 0, 0.25, 0, 0.75, 0, 0.75, 0, 1, 0.25, 1, 0.25, 1, 0.75, 0.75, 0.25, 1, 0],
+        'R': [0, 0, 0, 1, 0, 1, 0.75, 1, 0.75, 1, 1, 0.75, 1, 0.75, 0.75, 0.5, 
+                0.75, 0.5, 0, 0.5, 0.75, 0.5, 1, 0],
+        'S': [0, 0.25, 0.25, 0, 0.25, 0, 0.75, 0, 0.75, 0, 1, 0.25, 1, 0.25, 0.75, 0.5, 0.75, 0.5, 
+                0.25, 0.5, 0.25, 0.5, 0, 0.75, 0, 0.75, 0.25, 1, 0.25, 1, 0.75, 1, 0.75, 1, 1, 0.75],
+        'T': [0, 1, 1, 1, 0.5, 1, 0.5, 0],
+        'U': [0, 1, 0, 0.25, 0, 0.25, 0.25, 0, 0.25, 0, 0.75, 0, 0.75, 0, 1, 0.25, 1, 0.25, 1, 1],
+        'V': [0, 1, 0.5, 0, 0.5, 0, 1, 1],
+        'W': [0, 1, 0, 0, 0, 0, 0.5, 0.5, 0.5, 0.5, 1, 0, 1, 0, 1, 1],
+        'X': [0, 0, 1, 1, 1, 0, 0, 1],
+        'Y': [0, 1, 0.5, 0.5, 0.5, 0.5, 1, 1, 0.5, 0.5, 0.5, 0],
+        'Z': [0, 1, 1, 1, 1, 1, 0, 0, 0, 0, 1, 0],
+        '1': [0, 0.75, 0.5, 1, 0.5, 1, 0.5, 0, 0, 0, 1, 0],
+        '2': [1, 0, 0, 0, 0, 0, 0.75, 0.5, 0.75, 0.5, 1, 0.75, 1, 0.75, 0.75, 
+                1, 0.75, 1, 0.25, 1, 0.25, 1, 0, 0.75],
+        '3': [0, 0.75, 0.25, 1, 0.25, 1, 0.75, 1, 0.75, 1, 1, 0.75, 1, 0.75, 0.75, 0.5, 0.75, 
+                0.5, 1, 0.25, 1, 0.25, 0.75, 0, 0.75, 0, 0.25, 0, 0.25, 0, 0, 0.25, 0.25, 0.5, 0.75, 0.5],
+        '4': [0.75, 0, 0.75, 1, 0.75, 1, 0, 0.25, 0, 0.25, 1, 0.25],
+        '5': [1, 1, 0, 1, 0, 1, 0, 0.5, 0, 0.5, 0.75, 0.5, 0.75, 0.5, 1, 0.25, 
+                1, 0.25, 0.75, 0, 0.75, 0, 0, 0],
+        '6': [1, 0.75, 0.75, 1, 0.75, 1, 0.25, 1, 0.25, 1, 0, 0.75, 0, 0.75, 0, 0.25, 0, 0.25, 0.25, 
+                0, 0.25, 0, 0.75, 0, 0.75, 0, 1, 0.25, 1, 0.25, 0.75, 0.5, 0.75, 0.5, 0, 0.5],
+        '7': [0, 1, 1, 1, 1, 1, 0.25, 0],
+        '8': [0, 0.75, 0.25, 1, 0.25, 1, 0.75, 1, 0.75, 1, 1, 0.75, 1, 0.75, 0.75, 0.5, 0.75, 
+                0.5, 1, 0.25, 1, 0.25, 0.75, 0, 0.75, 0, 0.25, 0, 0.25, 0, 0, 0.25, 
+                0, 0.25, 0.25, 0.5, 0.25, 0.5, 0, 0.75, 0.25, 0.5, 0.75, 0.5],
+        '9': [0, 0.25, 0.25, 0, 0.25, 0, 0.75, 0, 0.75, 0, 1, 0.25, 1, 0.25, 1, 0.75, 1, 0.75, 
+                0.75, 1, 0.75, 1, 0.25, 1, 0.25, 1, 0, 0.75, 0, 0.75, 0.25, 0.5, 0.25, 0.5, 1, 0.5],
+        '0': [1, 0.75, 0.75, 1, 0.75, 1, 0.25, 1, 0.25, 1, 0, 0.75, 0, 0.75, 0, 0.25, 0, 0.25, 
+                0.25, 0, 0.25, 0, 0.75, 0, 0.75, 0, 1, 0.25, 1, 0.25, 1, 0.75, 0.75, 1, 0.25, 0],
+    }
+
+
+class MeteorShape():
+    # A meteor outline, in unit space like WObject.points: a point at each of
+    #  num_points evenly spaced angles, at a random distance from the center (radii).
+    # Also has the edges (pairs of points), the outward normal of each edge, and the
+    #  radius of the tightest circle around the center containing the outline.
+    # Shapes are shared by all the meteors using them, so they must not be modified.
+    def __init__(self, id, num_points, rng):
+        self.id = id
+        self.num_points = num_points
+        center = Vector2(0.5, 0.5)
+        interval = 360 / num_points
+        self.radii = []
+        corners = []
+        for i in range(num_points):
+            length = rng.uniform(0.7, 1) / 2
+            self.radii.append(length)
+            corners.append(center.copy().add_scaled(WObject.deg_to_vel(i * interval), length))
+        self.radius = max(self.radii)
+        self.points = []
+        self.edges = []
+        self.normals = []
+        self._edge_arrays = None
+        for i in range(num_points):
+            (start, end) = (corners[i], corners[(i + 1) % num_points])
+            self.points.append(start)
+            self.points.append(end)
+            self.edges.append((start, end))
+            # the corners go round counterclockwise, so outside is to the right
+            self.normals.append(Vector2(end.y - start.y, start.x - end.x).normalize_in_place())
+
+    def edge_arrays(self):
+        # the edges as two (n, 2) numpy arrays of start and end points
+        if self._edge_arrays == None:
+            self._edge_arrays = (
+                numpy.array([(start.x, start.y) for (start, end) in self.edges]),
+                numpy.array([(end.x, end.y) for (start, end) in self.edges]))
+        return self._edge_arrays
+
+    def contains(self, point):
+        # returns true if point (in unit space) is inside the outline
+        inside = False
+        for (start, end) in self.edges:
+            if (start.y > point.y) != (end.y > point.y):
+                x = start.x + (point.y - start.y) * (end.x - start.x) / (end.y - start.y)
+                if point.x < x:
+                    inside = not inside
+        return inside
+
+    def sweep(self, start, end):
+        # returns how far along the segment from start to end (in unit space, 0 to 1)
+        #  it first touches the outline, or None if it doesn't
+        if self.contains(start):
+            return 0.0
+        r = end - start
+        first = None
+        for (edge_start, edge_end) in self.edges:
+            s = edge_end - edge_start
+            det = r.cross(s)
+            if det == 0:
+                continue
+            q = edge_start - start
+            t = q.cross(s) / det
+            u = q.cross(r) / det
+            if 0 <= t <= 1 and 0 <= u <= 1 and (first == None or t < first):
+                first = t
+        return first
+
+
+class MeteorShapes():
+    # Library of meteor outlines, count for every number of points, made from a fixed
+    #  seed the first time they are needed. Meteors pick one of them at random instead
+    #  of making their own, and refer to it by id, which is the same in every game.
+    count = 16
+    seed = 1
+    # id => MeteorShape
+    shapes = dict()
+
+    @classmethod
+    def pick(cls, num_points, rng = random):
+        # a random shape with num_points points
+        return cls.get(num_points * cls.count + rng.randrange(cls.count))
+
+    @classmethod
+    def get(cls, id):
+        if id not in cls.shapes:
+            cls._build(id // cls.count)
+        return cls.shapes[id]
+
+    @classmethod
+    def _build(cls, num_points):
+        rng = random.Random(cls.seed * 1000 + num_points)
+        for i in range(cls.count):
+            id = num_points * cls.count + i
+            cls.shapes[id] = MeteorShape(id, num_points, rng)
 
 
 class Meteor(WObject):
     # Meteor bass class
-    def __init__(self, start_pos, start_deg, num_points, size, speed, max_health):
+    # A meteor can be added to a MeteorStore, which then owns its position, velocity,
+    #  angle, health and color and updates them for all meteors at once. The meteor
+    #  itself then only provides a view onto its row of the store.
+    store = None
+    # one update back, to draw in between updates
+    state_buffer = 1
+    # most points an outline can have (MeteorStore and MeteorRenderer make room for this many)
+    max_points = 20
+
+    # rng is where the randomness comes from, a random.Random or the random module
+    def __init__(self, start_pos, start_deg, num_points, size, speed, max_health, rng = random):
         WObject.__init__(self)
-        self.init_pos(start_pos)
-        self.vel = self.deg_to_vel(start_deg) * speed
         self.size = Vector2(size, size)
         self.num_points = num_points
-        self.points = self.generate_points()
-        self.turn_speed = random.uniform(-20, 20)
-
+        self.speed = speed
         self.max_health = max_health
+        self.draw_circle = False
+        self.reset(start_pos, start_deg, rng)
+
+    def reset(self, start_pos, start_deg, rng = random):
+        # (re)starts the meteor at start_pos, heading for start_deg, with a new shape.
+        #  lets a dead meteor be reused instead of making a new one
+        self.remove = False
+        self.init_pos(start_pos)
+        self.init_deg(0)
+        self.vel = self.deg_to_vel(start_deg)
+        self.vel *= self.speed
+        self.set_shape(MeteorShapes.pick(self.num_points, rng))
+        self.turn_speed = rng.uniform(-20, 20)
         self.health = self.max_health
+        self.color = [1, 1, 1]
 
-        self.draw_circle = False
+    def _get_pos(self):
+        if self.store:
+            return Vector2(float(self.store.pos[self.row, 0]), float(self.store.pos[self.row, 1]))
+        return self._pos
+
+    def _set_pos(self, pos):
+        if self.store:
+            self.store.pos[self.row] = (pos.x, pos.y)
+        else:
+            self._pos = pos
+        self.invalidate()
+
+    pos = property(_get_pos, _set_pos)
+
+    def _get_vel(self):
+        if self.store:
+            return Vector2(float(self.store.vel[self.row, 0]), float(self.store.vel[self.row, 1]))
+        return self._vel
+
+    def _set_vel(self, vel):
+        if self.store:
+            self.store.vel[self.row] = (vel.x, vel.y)
+        else:
+            self._vel = vel
+
+    vel = property(_get_vel, _set_vel)
+
+    def _get_deg(self):
+        if self.store:
+            return float(self.store.deg[self.row])
+        return self._deg
+
+    def _set_deg(self, deg):
+        if self.store:
+            self.store.deg[self.row] = deg
+        else:
+            self._deg = deg
+        self.invalidate()
+
+    deg = property(_get_deg, _set_deg)
+
+    def previous_state(self):
+        if self.store:
+            row = self.row
+            return (Vector2(float(self.store.prev_pos[row, 0]), float(self.store.prev_pos[row, 1])),
+                    float(self.store.prev_deg[row]))
+        return WObject.previous_state(self)
+
+    def _geometry(self):
+        # stored meteors move without update_pos, so also check if the store was updated
+        if self.store and self._cache_version != self.store.version:
+            self.invalidate()
+            self._cache_version = self.store.version
+        return self._cache
+
+    def _get_health(self):
+        if self.store:
+            return int(self.store.health[self.row])
+        return self._health
+
+    def _set_health(self, health):
+        if self.store:
+            self.store.health[self.row] = health
+        else:
+            self._health = health
+
+    health = property(_get_health, _set_health)
+
+    def _get_color(self):
+        if self.store:
+            return [float(c) for c in self.store.color[self.row]]
+        return self._color
+
+    def _set_color(self, color):
+        if self.store:
+            self.store.color[self.row] = color
+        else:
+            self._color = color
+
+    color = property(_get_color, _set_color)
 
     def bounding_circle(self):
-        return BoundingCircle(self.pos, self.size.x / 2)
+        # as tight as the outline allows
+        return BoundingCircle(self.pos, self.size.x * self.outline.radius)
 
     def hit(self):
         self.health = self.health - 1
         if self.health == 0:
             self.remove = True
 
-    def generate_points(self):
-        interval = 360 / self.num_points
-        points = []
-        first = None
-        for i in range(self.num_points):
-            deg = i * interval
-            length = random.uniform(0.7, 1) / 2
-            p = self.deg_to_vel(deg) * length + Vector2(0.5, 0.5)
-            points.append(p)
-            if i == 0:
-                first = p
-            else:
-                points.append(p)
-        points.append(first)
-        return points
+    def to_local(self, point):
+        # point in world space => unit space (the inverse of WObject._transform)
+        rad = math.radians(self.deg)
+        (sin, cos) = (math.sin(rad), math.cos(rad))
+        (dx, dy) = (point.x - self.pos.x, point.y - self.pos.y)
+        return Vector2((dx * cos + dy * sin) / self.size.x + self.anchor.x,
+                       (dy * cos - dx * sin) / self.size.y + self.anchor.y)
+
+    def time_of_impact(self, start, end):
+        # how far along the segment from start to end (world space, 0 to 1) it first
+        #  touches the meteor, or None if it doesn't. the outline is only tested if
+        #  the segment touches the bounding circle
+        if self.bounding_circle().sweep(start, end) == None:
+            return None
+        return self.outline.sweep(self.to_local(start), self.to_local(end))
+
+    def set_shape(self, shape):
+        # use shape (a MeteorShape) as the outline, kept in outline (not shape, which
+        #  is WObject.shape). its radii are kept in radii
+        self.outline = shape
+        self.radii = shape.radii
+        self.points = shape.points
+
+    def update(self, time, bounds):
+        if self.store:
+            # already updated along with the rest of the store
+            return
 
-    def update(self, time, window):
         # update color (white -> yellow -> red)
         # bias to make 1 health completely red and full health completely white
         # max_health must be greater than 1
         h = float(self.health - 1) / (self.max_health - 1)
+        color = self.color
         if h > 0.5: # approach yellow
-            self.color = [1, 1, (h - 0.5) / 0.5]
+            color[0] = 1
+            color[1] = 1
+            color[2] = (h - 0.5) / 0.5
         else: # approach red
-            self.color = [1, h / 0.5, 0]
+            color[0] = 1
+            color[1] = h / 0.5
+            color[2] = 0
        
         # rotate
         self.update_deg(self.deg + self.turn_speed * time)
 
         # update position
         # allow to dissappear off edge, but jump to the opposite edge once that happens
-        pos = self.pos + self.vel * time
-        (winx, winy) = window.get_size()
+        pos = self._next_pos().add_scaled(self.vel, time)
+        (winx, winy) = bounds.get_size()
         if pos.x < 0 - self.size.x / 2:
             pos.x = pos.x + (1.5 * self.size.x + winx)
         if pos.x > winx + self.size.x:
@@ -523,36 +1283,318 @@ class Meteor(WObject):
 
 class Meteor1(Meteor):
     # big meteor
-    def __init__(self, start_pos, start_deg):
-        Meteor.__init__(self, start_pos, start_deg, 18, 200, 40, 6)
+    def __init__(self, start_pos, start_deg, rng = random):
+        Meteor.__init__(self, start_pos, start_deg, 18, 200, 40, 6, rng)
 
 
 class Meteor2(Meteor):
     # medium meteor
-    def __init__(self, start_pos, start_deg):
-        Meteor.__init__(self, start_pos, start_deg, 12, 100, 60, 4)
+    def __init__(self, start_pos, start_deg, rng = random):
+        Meteor.__init__(self, start_pos, start_deg, 12, 100, 60, 4, rng)
 
 
 class Meteor3(Meteor):
     # small meteor
-    def __init__(self, start_pos, start_deg):
-        Meteor.__init__(self, start_pos, start_deg, 8, 40, 80, 2)
+    def __init__(self, start_pos, start_deg, rng = random):
+        Meteor.__init__(self, start_pos, start_deg, 8, 40, 80, 2, rng)
+
+
+class MeteorStore():
+    # Structure of arrays holding the state of many meteors (requires numpy).
+    # update() does the same as Meteor.update, but for every meteor in the store at once.
+    # The position/angle history of stored meteors is not kept up to date.
+    def __init__(self, capacity = 64):
+        self.count = 0
+        self.meteors = []
+        self.pos = numpy.zeros((capacity, 2))
+        self.vel = numpy.zeros((capacity, 2))
+        self.deg = numpy.zeros(capacity)
+        # state as of the update before, to draw in between updates
+        self.prev_pos = numpy.zeros((capacity, 2))
+        self.prev_deg = numpy.zeros(capacity)
+        self.turn_speed = numpy.zeros(capacity)
+        self.health = numpy.zeros(capacity, dtype = int)
+        self.max_health = numpy.ones(capacity, dtype = int)
+        self.size = numpy.zeros(capacity)
+        self.color = numpy.ones((capacity, 3))
+        # the outlines, as in Meteor.radii
+        self.num_points = numpy.zeros(capacity, dtype = int)
+        self.radii = numpy.zeros((capacity, Meteor.max_points))
+        # bumped every update, so meteors know their cached geometry is out of date
+        self.version = 0
+
+    def add(self, meteor):
+        # take over the state of meteor, which from then on reads it from the store
+        if self.count == len(self.size):
+            self._grow(2 * self.count)
+        row = self.count
+        (pos, vel, deg, health, color) = (meteor.pos, meteor.vel, meteor.deg,
+                                          meteor.health, meteor.color)
+        self.pos[row] = (pos.x, pos.y)
+        self.vel[row] = (vel.x, vel.y)
+        self.deg[row] = deg
+        self.prev_pos[row] = (pos.x, pos.y)
+        self.prev_deg[row] = deg
+        self.turn_speed[row] = meteor.turn_speed
+        self.health[row] = health
+        self.max_health[row] = meteor.max_health
+        self.size[row] = meteor.size.x
+        self.color[row] = color
+        self.num_points[row] = meteor.num_points
+        self.radii[row, :meteor.num_points] = meteor.radii
+        self.meteors.append(meteor)
+        self.count = self.count + 1
+        meteor.row = row
+        meteor.store = self
+        meteor._cache_version = self.version
+
+    def remove(self, meteor):
+        # hand the state back to meteor, and move the last row into its place
+        (pos, vel, deg, health, color) = (meteor.pos, meteor.vel, meteor.deg,
+                                          meteor.health, meteor.color)
+        row = meteor.row
+        meteor.store = None
+        meteor.row = None
+        (meteor.pos, meteor.vel, meteor.deg, meteor.health, meteor.color) = (
+            pos, vel, deg, health, color)
+        last = self.count - 1
+        if row != last:
+            for array in self._arrays():
+                array[row] = array[last]
+            moved = self.meteors[last]
+            self.meteors[row] = moved
+            moved.row = row
+        self.meteors.pop()
+        self.count = last
+
+    def clear(self):
+        while self.count:
+            self.remove(self.meteors[-1])
+
+    def update(self, time, bounds):
+        self.version = self.version + 1
+        n = self.count
+        if n == 0:
+            return
+        # update color (white -> yellow -> red), see Meteor.update
+        h = (self.health[:n] - 1).astype(float) / (self.max_health[:n] - 1)
+        yellow = h > 0.5
+        color = self.color[:n]
+        color[:, 0] = 1
+        color[:, 1] = numpy.where(yellow, 1, h / 0.5)
+        color[:, 2] = numpy.where(yellow, (h - 0.5) / 0.5, 0)
+
+        self.prev_pos[:n] = self.pos[:n]
+        self.prev_deg[:n] = self.deg[:n]
+
+        # rotate
+        self.deg[:n] += self.turn_speed[:n] * time
+
+        # update position, jumping to the opposite edge once off the edge
+        pos = self.pos[:n]
+        pos += self.vel[:n] * time
+        size = self.size[:n]
+        (winx, winy) = bounds.get_size()
+        jump_x = 1.5 * size + winx
+        jump_y = 1.5 * size + winy
+        x = pos[:, 0]
+        y = pos[:, 1]
+        x[x < 0 - size / 2] += jump_x[x < 0 - size / 2]
+        x[x > winx + size] -= jump_x[x > winx + size]
+        y[y < 0 - size] += jump_y[y < 0 - size]
+        y[y > winy + size] -= jump_y[y > winy + size]
+
+    def _arrays(self):
+        return [self.pos, self.vel, self.deg, self.prev_pos, self.prev_deg, self.turn_speed,
+                self.health, self.max_health, self.size, self.color, self.num_points, self.radii]
+
+    def _grow(self, capacity):
+        (self.pos, self.vel, self.deg, self.prev_pos, self.prev_deg, self.turn_speed,
+         self.health, self.max_health, self.size, self.color, self.num_points, self.radii) = [
+            numpy.resize(array, (capacity,) + array.shape[1:]) for array in self._arrays()]
+
+
+class MeteorRenderer():
+    # Draws all meteors with a single instanced draw call (requires OpenGL 3.3 and numpy).
+    # Every meteor is drawn from the same static vertex buffer, which just counts around
+    #  the largest possible outline. Per meteor, an instance buffer holds its position,
+    #  angle, size, color and outline (the radius of each of its points, see
+    #  MeteorShape), and a vertex shader does the transform WObject.draw does.
+    # The instance buffer is refilled every frame, straight from a MeteorStore if there is one.
+
+    vertex_shader = """
+        #version 330 compatibility
+        in float corner;    // which outline point, counting round the outline
+        in vec4 place;      // x, y, angle in degrees, size
+        in vec4 tint;       // r, g, b, number of outline points
+        in vec4 radii[%(radii)d];
+        out vec3 color;
+        void main() {
+            int n = int(tint.w);
+            if (gl_VertexID / 2 >= n) {
+                // the meteor has fewer points than this, so put the line off screen
+                gl_Position = vec4(2.0, 2.0, 2.0, 1.0);
+                return;
+            }
+            int k = int(corner) %% n;
+            float radius = radii[k / 4][k %% 4];
+            // same direction as WObject.deg_to_vel, with the angle step Meteor uses
+            float angle = radians(float(k * (360 / n)));
+            vec2 point = vec2(-sin(angle), cos(angle)) * radius * place.w;
+            float deg = radians(place.z);
+            point = vec2(point.x * cos(deg) - point.y * sin(deg),
+                         point.x * sin(deg) + point.y * cos(deg)) + place.xy;
+            gl_Position = gl_ModelViewProjectionMatrix * vec4(point, 0.0, 1.0);
+            color = tint.rgb;
+        }
+    """
+
+    fragment_shader = """
+        #version 330 compatibility
+        in vec3 color;
+        out vec4 frag_color;
+        void main() {
+            frag_color = vec4(color, 1.0);
+        }
+    """
+
+    @staticmethod
+    def supported():
+        return bool(pyglet and numpy and pyglet.gl.gl_info.have_version(3, 3))
+
+    def __init__(self):
+        self.radii_vectors = (Meteor.max_points + 3) // 4
+        # floats per instance: place, tint and the radii
+        self.stride = 8 + 4 * self.radii_vectors
+        self.program = self._link({
+            GL_VERTEX_SHADER: self.vertex_shader % {'radii': self.radii_vectors},
+            GL_FRAGMENT_SHADER: self.fragment_shader})
+        self.corners = self._buffer(numpy.array(
+            [(i + 1) // 2 for i in range(2 * Meteor.max_points)], dtype = numpy.float32),
+            GL_STATIC_DRAW)
+        self.instances = self._buffer(numpy.zeros(self.stride, dtype = numpy.float32),
+                                      GL_STREAM_DRAW)
+
+    # alpha < 1 draws the meteors that far between their previous and current state,
+    #  as in WObject.interpolated_state
+
+    def draw(self, meteors, alpha = 1, bounds = None):
+        # draws a list of meteors
+        data = numpy.zeros((len(meteors), self.stride), dtype = numpy.float32)
+        for (i, meteor) in enumerate(meteors):
+            if alpha == 1:
+                (pos, deg) = (meteor.pos, meteor.deg)
+            else:
+                (pos, deg) = meteor.interpolated_state(alpha, bounds)
+            color = meteor.color
+            data[i, 0:8] = (pos.x, pos.y, deg, meteor.size.x,
+                            color[0], color[1], color[2], meteor.num_points)
+            data[i, 8:8 + meteor.num_points] = meteor.radii
+        self._draw(data)
+
+    def draw_store(self, store, alpha = 1, bounds = None):
+        # draws all the meteors in a MeteorStore
+        n = store.count
+        data = numpy.zeros((n, self.stride), dtype = numpy.float32)
+        if alpha == 1:
+            data[:, 0:2] = store.pos[:n]
+            data[:, 2] = store.deg[:n]
+        else:
+            (pos, old_pos) = (store.pos[:n], store.prev_pos[:n])
+            delta = pos - old_pos
+            (winx, winy) = bounds.get_size()
+            jumped = (numpy.abs(delta[:, 0]) > winx / 2) | (numpy.abs(delta[:, 1]) > winy / 2)
+            data[:, 0:2] = numpy.where(jumped[:, None], pos, old_pos + delta * alpha)
+            turn = (store.deg[:n] - store.prev_deg[:n] + 180) % 360 - 180
+            data[:, 2] = numpy.where(jumped, store.deg[:n], store.prev_deg[:n] + turn * alpha)
+        data[:, 3] = store.size[:n]
+        data[:, 4:7] = store.color[:n]
+        data[:, 7] = store.num_points[:n]
+        data[:, 8:8 + Meteor.max_points] = store.radii[:n]
+        self._draw(data)
+
+    def _draw(self, data):
+        if len(data) == 0:
+            return
+        glUseProgram(self.program)
+        glBindBuffer(GL_ARRAY_BUFFER, self.corners)
+        glEnableVertexAttribArray(0)
+        glVertexAttribPointer(0, 1, GL_FLOAT, GL_FALSE, 0, 0)
+        glBindBuffer(GL_ARRAY_BUFFER, self.instances)
+        glBufferData(GL_ARRAY_BUFFER, data.nbytes, data.ctypes.data, GL_STREAM_DRAW)
+        locations = range(1, 3 + self.radii_vectors)
+        for location in locations:
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(location, 4, GL_FLOAT, GL_FALSE, 4 * self.stride,
+                                  16 * (location - 1))
+            glVertexAttribDivisor(location, 1)
+        glDrawArraysInstanced(GL_LINES, 0, 2 * Meteor.max_points, len(data))
+        # leave things as pyglet expects them
+        for location in locations:
+            glVertexAttribDivisor(location, 0)
+            glDisableVertexAttribArray(location)
+        glDisableVertexAttribArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glUseProgram(0)
+
+    def _buffer(self, data, usage):
+        buf = GLuint()
+        glGenBuffers(1, ctypes.byref(buf))
+        glBindBuffer(GL_ARRAY_BUFFER, buf)
+        glBufferData(GL_ARRAY_BUFFER, data.nbytes, data.ctypes.data, usage)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        return buf.value
+
+    def _link(self, sources):
+        program = glCreateProgram()
+        for (kind, source) in sources.items():
+            shader = glCreateShader(kind)
+            text = ctypes.c_char_p(source.encode('ascii'))
+            glShaderSource(shader, 1, ctypes.cast(ctypes.pointer(text),
+                           ctypes.POINTER(ctypes.POINTER(GLchar))), None)
+            glCompileShader(shader)
+            self._check(shader, glGetShaderiv, glGetShaderInfoLog, GL_COMPILE_STATUS)
+            glAttachShader(program, shader)
+        for (location, name) in enumerate(['corner', 'place', 'tint', 'radii']):
+            glBindAttribLocation(program, location, name.encode('ascii'))
+        glLinkProgram(program)
+        self._check(program, glGetProgramiv, glGetProgramInfoLog, GL_LINK_STATUS)
+        return program
+
+    def _check(self, obj, get_iv, get_log, status):
+        # raise with the info log if compiling/linking failed
+        result = GLint(0)
+        get_iv(obj, status, ctypes.byref(result))
+        if not result.value:
+            log = ctypes.create_string_buffer(4096)
+            get_log(obj, len(log), None, log)
+            raise RuntimeError('shader error: ' + log.value.decode('ascii', 'replace'))
 
 
 class Bullet(WObject):
     # gun projectile
+    # the collision detection sweeps from last_pos[1]
+    state_buffer = 2
+
     def __init__(self, start_pos, start_deg):
         WObject.__init__(self)
-        self.init_pos(start_pos)
-        self.vel = self.deg_to_vel(start_deg) * 500
-        self.init_deg(start_deg)
         self.size = Vector2(5, 9)
+        self.sweep = 2
         self.points = self.to_points([0, 0, 0.5, 1, 0.5, 1, 1, 0, 1, 0, 0, 0])
+        self.reset(start_pos, start_deg)
+
+    def reset(self, start_pos, start_deg):
+        # (re)fires the bullet from start_pos at start_deg
+        self.remove = False
+        self.init_pos(start_pos)
+        self.vel = self.deg_to_vel(start_deg)
+        self.vel *= 500
+        self.init_deg(start_deg)
 
-    def update(self, time, window):
+    def update(self, time, bounds):
         # update position and flag for removal if off screen
-        self.update_pos(self.pos + self.vel * time)
-        (winx, winy) = window.get_size()
+        self.update_pos(self._next_pos().add_scaled(self.vel, time))
+        (winx, winy) = bounds.get_size()
         if self.pos.x < 0 or self.pos.x > winx or self.pos.y < 0 or self.pos.y > winy:
             self.remove = True
 
@@ -561,12 +1603,16 @@ class Bullet(WObject):
 
 class Ship(WObject):
     # the players ship
+    # the collision detection sweeps from 2 updates ago (last_pos[1], last_deg[1])
+    state_buffer = 3
+
     def __init__(self, start_pos):
         WObject.__init__(self)
         self.init_pos(start_pos)
         self.size = Vector2(20, 40)
         self.init_deg(0)
         self.vel = Vector2(0, 0)
+        self.sweep = 2
 
         self.accel = 300
         self.turn_speed = 200
@@ -593,26 +1639,27 @@ class Ship(WObject):
         else:
             self.thrust_state = None
 
-    def update(self, time, window):
+    def update(self, time, bounds):
         # update velocity
         if self.thrust_state:
-            added_vel = self.deg_to_vel(self.deg) * self.accel * time
+            direction = self.deg_to_vel(self.deg)
+            direction *= self.accel
             if self.thrust_state == THRUST.forward:
-                self.vel = self.vel + added_vel
+                self.vel.add_scaled(direction, time)
             elif self.thrust_state == THRUST.back:
-                self.vel = self.vel - added_vel
-
-        # update angle
-        if self.turn_state:
-            if self.turn_state == TURN.left:
-                self.update_deg(self.deg + self.turn_speed * time)
-            elif self.turn_state == TURN.right:
-                self.update_deg(self.deg - self.turn_speed * time)
-            self.update_deg(self.deg % 360)
+                self.vel.add_scaled(direction, -time)
+
+        # update angle, once every update so the history lines up with last_pos
+        deg = self.deg
+        if self.turn_state == TURN.left:
+            deg = deg + self.turn_speed * time
+        elif self.turn_state == TURN.right:
+            deg = deg - self.turn_speed * time
+        self.update_deg(deg % 360)
        
-        # update position based on velocity and keep within window
-        pos = self.pos + self.vel * time
-        (winx, winy) = window.get_size()
+        # update position based on velocity and keep within the world bounds
+        pos = self._next_pos().add_scaled(self.vel, time)
+        (winx, winy) = bounds.get_size()
         pos.x = pos.x % winx
         pos.y = pos.y % winy
         self.update_pos(pos)
@@ -621,91 +1668,573 @@ class Ship(WObject):
 class Collider():
     # Helper class to aid with collision detection.
     # Register collision detection and handling methods for particular pairs of
-    # objects (by class name), and you can then just call Collider.collide(obj1, obj2),
-    # and Collider.handle(obj1, obj2) and this class will call the appropriate methods.
+    # object classes, and you can then just call Collider.collide_and_handle(obj1, obj2)
+    # and this class will call the appropriate methods. Methods registered for a class
+    # also apply to its subclasses, unless something more specific was registered.
+    # interactions() tells which of a list of classes can collide at all, so the
+    # others never need to be tested.
     def __init__(self):
         self.method_dict = dict()
+        # (class1, class2) => (detector, handler, swapped) or None, filled on first lookup
+        self.dispatch = dict()
 
     def register_methods(self, detector, handler, type1, type2):
         # Pass in a collision detection method, a collision handling method,
-        #  and two object class names as strings.
+        #  and two object classes.
         # The methods are expected to accept two arguments (the two objects)
         #  in the order which their types are submitted. Will raise an error if you register
         #  a method for the same pair of objects
-        if self._find_methods(type1, type2) != None or self._find_methods(type2, type1) != None:
-            raise('Already registered methods for ' + type1 + ' and ' + type2)
-        if not type1 in self.method_dict:
-            self.method_dict[type1] = dict()
-        self.method_dict[type1][type2] = [detector, handler]
-
-    def collide(self, obj1, obj2):
+        if (type1, type2) in self.method_dict or (type2, type1) in self.method_dict:
+            raise ValueError('Already registered methods for %s and %s' %
+                             (type1.__name__, type2.__name__))
+        self.method_dict[(type1, type2)] = [detector, handler]
+        self.dispatch = dict()
+
+    def interactions(self, classes):
+        # returns (class1, class2, detector, handler) for each pair of different
+        #  classes from classes that has methods, with the classes in the order the
+        #  methods take the objects
+        found = []
+        for (i, class1) in enumerate(classes):
+            for class2 in classes[i + 1:]:
+                methods = self.lookup(class1, class2)
+                if methods == None:
+                    continue
+                (detector, handler, swapped) = methods
+                if swapped:
+                    found.append((class2, class1, detector, handler))
+                else:
+                    found.append((class1, class2, detector, handler))
+        return found
+
+    def lookup(self, class1, class2):
+        # returns (detector, handler, swapped) for the pair of classes, or None if they
+        #  don't interact. swapped means the methods expect the objects the other way round
+        pair = (class1, class2)
+        if pair not in self.dispatch:
+            self.dispatch[pair] = self._resolve(class1, class2)
+        return self.dispatch[pair]
+
+    def collide_and_handle(self, obj1, obj2, detected = False):
         # Pass it any two world objects (in any order) and it will call the appropriate
-        #   collision detection method (based on their type) and return true if they collided.
-        # If there is no method registered for that pair, it will return false.
+        #   collision detection method, and if they collided the handling method as well.
+        #   With detected, they are already known to have collided (say from the time of
+        #   impact a detector returned), and only the handling method is called.
+        # Returns true if they collided, and false if they didn't or there is
+        #   no method registered for that pair.
         if obj1.remove or obj2.remove:
             return False
-        type1 = self._type(obj1)
-        type2 = self._type(obj2)
-        methods1 = self._find_methods(type1, type2)
-        methods2 = self._find_methods(type2, type1)
-        if methods1 == None and methods2 == None:
+        methods = self.lookup(obj1.__class__, obj2.__class__)
+        if methods == None:
             return False
-        # only one of these will do something
-        if methods1 != None:
-            return methods1[0](obj1, obj2)
-        elif methods2 != None:
-            return methods2[0](obj2, obj1)
+        (detector, handler, swapped) = methods
+        if swapped:
+            (obj1, obj2) = (obj2, obj1)
+        if detected or detector(obj1, obj2):
+            handler(obj1, obj2)
+            return True
         return False
 
-    def handle(self, obj1, obj2):
-        # Pass it any two world objects (in any order) and it will call the appropriate
-        #   collision handling method (based on their type).
-        # If there is no method registered for that pair, it will do nothing.
-        if obj1.remove or obj2.remove:
-            return
-        type1 = self._type(obj1)
-        type2 = self._type(obj2)
-        methods1 = self._find_methods(type1, type2)
-        methods2 = self._find_methods(type2, type1)
-        if methods1 == None and methods2 == None:
+    def _resolve(self, class1, class2):
+        # find the registered pair closest to (class1, class2) in their class hierarchies
+        best = None
+        best_distance = None
+        for (i, base1) in enumerate(inspect.getmro(class1)):
+            for (j, base2) in enumerate(inspect.getmro(class2)):
+                for (pair, swapped) in [((base1, base2), False), ((base2, base1), True)]:
+                    if pair in self.method_dict and (best == None or i + j < best_distance):
+                        (detector, handler) = self.method_dict[pair]
+                        best = (detector, handler, swapped)
+                        best_distance = i + j
+        return best
+
+
+class EntityStore():
+    # Game objects of one kind (class), packed in a list. Each object knows its slot
+    #  (its index in the list), so one can be removed in O(1) by moving the last
+    #  object into its slot.
+    # Removals during an update are queued with discard() and done all at once by
+    #  compact(), so until then slots don't change and iterating skips nothing.
+    # batch is the pyglet Batch the objects are drawn with, if any.
+    def __init__(self, kind = WObject):
+        self.kind = kind
+        self.batch = None
+        self.items = []
+        self.doomed = []
+        self.doomed_set = set()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __getitem__(self, slot):
+        return self.items[slot]
+
+    def add(self, obj):
+        obj.slot = len(self.items)
+        self.items.append(obj)
+
+    def remove(self, obj):
+        # removes obj right away
+        slot = obj.slot
+        last = self.items.pop()
+        if last is not obj:
+            self.items[slot] = last
+            last.slot = slot
+        obj.slot = None
+
+    def discard(self, obj):
+        # queues obj to be removed by compact() (once, however often it's discarded)
+        if obj not in self.doomed_set:
+            self.doomed_set.add(obj)
+            self.doomed.append(obj)
+
+    def compact(self):
+        # removes the queued objects that are still here, returns them in the
+        #  order they were queued
+        removed = []
+        for obj in self.doomed:
+            if obj.slot != None and self.items[obj.slot] is obj:
+                self.remove(obj)
+                removed.append(obj)
+        self.doomed = []
+        self.doomed_set = set()
+        return removed
+
+    def clear(self):
+        for obj in self.items:
+            obj.slot = None
+        self.items = []
+        self.doomed = []
+        self.doomed_set = set()
+
+
+class ObjectPool():
+    # Dead objects of one class, kept to be reused instead of making new ones.
+    # get() resets one (see Bullet.reset, Meteor.reset) with the arguments the class
+    #  would be made with, or makes a new one if there are none left. put() takes one back.
+    def __init__(self, cls, size = 0, *args):
+        # size objects are made up front, from args
+        self.cls = cls
+        self.args = args
+        self.free = [cls(*args) for i in range(size)]
+
+    def __len__(self):
+        return len(self.free)
+
+    def get(self, *args):
+        if self.free:
+            obj = self.free.pop()
+            obj.reset(*args)
+            return obj
+        return self.cls(*args)
+
+    def take(self):
+        # an object as it is, for the caller to set up. new ones are made from the
+        #  args the pool was made with
+        if self.free:
+            return self.free.pop()
+        return self.cls(*self.args)
+
+    def put(self, obj):
+        self.free.append(obj)
+
+
+class FrameProfiler():
+    # Times the phases of each frame (a frame is an update, with all of its steps,
+    #  and the draw after it). Keeps the last window frames for rolling averages,
+    #  and the worst frame since reset().
+    # start(phase) and stop(phase) can be called any number of times per frame,
+    #  the times add up.
+    # While enabled is false, nothing is timed or counted.
+    phases = ('update', 'broadphase', 'narrowphase', 'removal', 'draw')
+
+    def __init__(self, window = 60, enabled = True):
+        self.window = window
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.history = History(self.window, None)
+        self.frames = 0
+        self.worst = None
+        self.current = dict.fromkeys(self.phases, 0.0)
+        self.started = {}
+
+    def start(self, phase):
+        if self.enabled:
+            self.started[phase] = clock()
+
+    def stop(self, phase):
+        if self.enabled:
+            self.current[phase] = self.current[phase] + clock() - self.started[phase]
+
+    def next_frame(self):
+        # ends the current frame, and starts a new one
+        if not self.enabled:
             return
-        # only one of these will do something
-        if methods1 != None:
-            methods1[1](obj1, obj2)
-        elif methods2 != None:
-            methods2[1](obj2, obj1)
-
-    def _find_methods(self, type1, type2):
-        if type1 in self.method_dict:
-            if type2 in self.method_dict[type1]:
-                return self.method_dict[type1][type2]
-        return None
+        frame = self.current
+        frame['frame'] = sum(frame[phase] for phase in self.phases)
+        self.history.push(frame)
+        self.frames = self.frames + 1
+        if self.worst == None or frame['frame'] > self.worst['frame']:
+            self.worst = frame
+        self.current = dict.fromkeys(self.phases, 0.0)
+
+    def stats(self):
+        # {phase: {'last', 'average', 'max'}, 'worst': {phase: time}, 'frames': n}
+        # for each phase and 'frame' (the whole frame), times in seconds. 'max' is the
+        #  longest the phase took in the rolling window, 'worst' is the worst frame since
+        #  reset(), broken down by phase
+        frames = [self.history[i] for i in range(min(self.frames, self.window))]
+        stats = {'frames': self.frames, 'worst': dict(self.worst or {})}
+        for phase in self.phases + ('frame',):
+            times = [frame[phase] for frame in frames] or [0.0]
+            stats[phase] = {
+                'last': times[0],
+                'average': sum(times) / len(times),
+                'max': max(times)}
+        return stats
+
+
+class InputRecording():
+    # Key events of a game session, each with the number of fixed steps the game had
+    #  run when it happened and the game time, plus the seed, step size, weapon and
+    #  collision mode of the game.
+    # Together that is enough to play the session back exactly (see Replay).
+    # Saved as a small binary file: a header, then one fixed size record per event.
+    #  A fire_rate of None is saved as 0.
+    header = struct.Struct('<4sIQddIBI')
+    event = struct.Struct('<IdIIB')
+    magic = b'MREC'
+    version = 2
+
+    def __init__(self, seed, fixed_dt, weapon = None, continuous = False):
+        self.seed = seed
+        self.fixed_dt = fixed_dt
+        self.weapon = weapon or Weapon()
+        self.continuous = continuous
+        # (step, time, symbol, modifiers, press)
+        self.events = []
+
+    def record(self, step, time, symbol, modifiers, press):
+        self.events.append((step, time, symbol, modifiers, press))
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.header.pack(self.magic, self.version, self.seed, self.fixed_dt,
+                                     self.weapon.fire_rate or 0, self.weapon.max_bullets,
+                                     self.continuous, len(self.events)))
+            for event in self.events:
+                f.write(self.event.pack(*event))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        (magic, version) = struct.unpack_from('<4sI', data, 0)
+        if magic != cls.magic or version != cls.version:
+            raise ValueError('%s is not a recording this version can read' % path)
+        (magic, version, seed, fixed_dt, fire_rate, max_bullets, continuous,
+         count) = cls.header.unpack_from(data, 0)
+        recording = cls(seed, fixed_dt, Weapon(fire_rate or None, max_bullets),
+                        bool(continuous))
+        for i in range(count):
+            (step, time, symbol, modifiers, press) = cls.event.unpack_from(
+                data, cls.header.size + i * cls.event.size)
+            recording.record(step, time, symbol, modifiers, bool(press))
+        return recording
+
+
+class Replay():
+    # Plays the events of an InputRecording back into a game, each before the same
+    #  fixed step it happened before. The game must be new, made with the recording's
+    #  seed, weapon and collision mode, and stepped with the recording's fixed_dt
+    #  (Game.replay sets up the seed and step, and checks the rest).
+    def __init__(self, recording):
+        self.recording = recording
+        self.next = 0
+
+    def done(self):
+        return self.next >= len(self.recording.events)
+
+    def play(self, game):
+        # feeds the game all the events due before its next step
+        events = self.recording.events
+        while self.next < len(events) and events[self.next][0] <= game.steps:
+            (step, time, symbol, modifiers, press) = events[self.next]
+            self.next = self.next + 1
+            game.on_key(symbol, modifiers, press)
+
+
+class Snapshot():
+    # Packs the whole state of a game between steps into a flat binary buffer, and
+    #  puts it back (into the same or another game with the same bounds and options).
+    #  Meteor outlines are saved as their MeteorShapes id.
+    # The buffer is a header (the game's state, counters and the state of its
+    #  random.Random), then a fixed size record per ship, bullet and meteor (position,
+    #  velocity, angle and their history, and what else each kind has), then the texts.
+    header = struct.Struct('<4sIBqIqIQddBBdB625I6I')
+    ship = struct.Struct('<5d9dbb')
+    bullet = struct.Struct('<5d6d')
+    meteor = struct.Struct('<12dHH')
+    text = struct.Struct('<8dBBBH')
+    magic = b'MSNP'
+    version = 1
+    # text justifications, by code
+    justifications = ['left', 'right', 'center', 'top', 'bottom']
+
+    @classmethod
+    def capture(cls, game):
+        # the state of game as a bytearray
+        (texts, ships, bullets) = (game.texts, game.ships, game.bullets)
+        meteors = [meteor for pool in game.meteor_pools for meteor in pool]
+        strings = [text.string.encode('ascii') for text in texts]
+        size = (cls.header.size + len(ships) * cls.ship.size + len(bullets) * cls.bullet.size +
+                len(meteors) * cls.meteor.size + len(texts) * cls.text.size +
+                sum(len(string) for string in strings))
+        data = bytearray(size)
+        (rng_version, words, gauss) = game.random.getstate()
+        cls.header.pack_into(
+            data, 0, cls.magic, cls.version, game.state, game.score, game.level,
+            game.last_score, game.last_level, game.steps, game.accumulator,
+            game.fire_cooldown, game.firing, gauss != None, gauss or 0.0, rng_version,
+            *(tuple(words) + tuple(len(pool) for pool in game.pools)))
+        offset = cls.header.size
+        for ship in ships:
+            cls.ship.pack_into(data, offset, *(cls._motion(ship) + (
+                ship.turn_state or 0, ship.thrust_state or 0)))
+            offset = offset + cls.ship.size
+        for bullet in bullets:
+            cls.bullet.pack_into(data, offset, *cls._motion(bullet))
+            offset = offset + cls.bullet.size
+        for meteor in meteors:
+            (pos, vel, (last_pos, last_deg)) = (meteor.pos, meteor.vel, meteor.previous_state())
+            color = meteor.color
+            cls.meteor.pack_into(
+                data, offset, pos.x, pos.y, vel.x, vel.y, meteor.deg, last_pos.x, last_pos.y,
+                last_deg, meteor.turn_speed, color[0], color[1], color[2], meteor.health,
+                meteor.outline.id)
+            offset = offset + cls.meteor.size
+        for (text, string) in zip(texts, strings):
+            opts = text.opts
+            cls.text.pack_into(
+                data, offset, text.pos.x, text.pos.y, text.size.x, text.size.y,
+                opts['spacing'], text.color[0], text.color[1], text.color[2],
+                cls.justifications.index(opts['just-x']),
+                cls.justifications.index(opts['just-y']), text is game.score_text, len(string))
+            offset = offset + cls.text.size
+            data[offset:offset + len(string)] = string
+            offset = offset + len(string)
+        return data
+
+    @staticmethod
+    def _motion(obj):
+        # position, velocity and angle, then the position and angle history
+        values = (obj.pos.x, obj.pos.y, obj.vel.x, obj.vel.y, obj.deg)
+        for i in range(obj.state_buffer):
+            (pos, deg) = (obj.last_pos[i], obj.last_deg[i])
+            values = values + (pos.x, pos.y, deg)
+        return values
+
+    @staticmethod
+    def _set_motion(obj, values):
+        # the other way round from _motion
+        obj.pos = Vector2(values[0], values[1])
+        obj.vel = Vector2(values[2], values[3])
+        obj.deg = values[4]
+        history = values[5:]
+        obj.last_pos.values = [Vector2(history[i], history[i + 1])
+                               for i in range(0, len(history), 3)]
+        obj.last_deg.values = list(history[2::3])
+        obj.last_pos.head = 0
+        obj.last_deg.head = 0
+        obj.invalidate()
+
+    @classmethod
+    def restore(cls, game, data):
+        # puts the state in data (from capture) back into game, in place of what it has
+        header = cls.header.unpack_from(data, 0)
+        (magic, version, state, score, level, last_score, last_level, steps, accumulator,
+         fire_cooldown, firing, has_gauss, gauss, rng_version) = header[:14]
+        if magic != cls.magic or version != cls.version:
+            raise ValueError('not a snapshot this version can read')
+        words = header[14:-6]
+        (num_texts, num_ships, num_bullets) = header[-6:-3]
+        num_meteors = header[-3:]
+
+        # the ship and texts are reused, like the bullets and meteors in object_pools
+        ships = [ship for ship in game.ships]
+        fonts = [text for text in game.texts]
+        game.remove_all_items()
+        (game.state, game.score, game.level) = (state, score, level)
+        (game.last_score, game.last_level, game.steps) = (last_score, last_level, steps)
+        (game.accumulator, game.fire_cooldown, game.firing) = (
+            accumulator, fire_cooldown, bool(firing))
+        if not has_gauss:
+            gauss = None
+        game.random.setstate((rng_version, tuple(words), gauss))
+
+        offset = cls.header.size
+        game.ship = None
+        for i in range(num_ships):
+            values = cls.ship.unpack_from(data, offset)
+            offset = offset + cls.ship.size
+            if ships:
+                ship = ships.pop()
+                ship.remove = False
+            else:
+                ship = Ship(Vector2(0, 0))
+            cls._set_motion(ship, values[:-2])
+            ship.turn_state = values[-2] or None
+            ship.thrust_state = values[-1] or None
+            game.ship = ship
+            game.add_item(ship)
+        for i in range(num_bullets):
+            values = cls.bullet.unpack_from(data, offset)
+            offset = offset + cls.bullet.size
+            bullet = game.object_pools[Bullet].take()
+            bullet.remove = False
+            cls._set_motion(bullet, values)
+            game.add_item(bullet)
+        for (meteor_class, count) in zip((Meteor1, Meteor2, Meteor3), num_meteors):
+            for i in range(count):
+                (x, y, vx, vy, deg, last_x, last_y, last_deg, turn_speed, r, g, b,
+                 health, shape) = cls.meteor.unpack_from(data, offset)
+                offset = offset + cls.meteor.size
+                meteor = game.object_pools[meteor_class].take()
+                meteor.remove = False
+                cls._set_motion(meteor, (x, y, vx, vy, deg, last_x, last_y, last_deg))
+                meteor.set_shape(MeteorShapes.get(shape))
+                meteor.turn_speed = turn_speed
+                meteor.health = health
+                meteor.color = [r, g, b]
+                game.add_item(meteor)
+                if meteor.store:
+                    meteor.store.prev_pos[meteor.row] = (last_x, last_y)
+                    meteor.store.prev_deg[meteor.row] = last_deg
+        game.score_text = None
+        for i in range(num_texts):
+            (x, y, width, height, spacing, r, g, b, just_x, just_y, is_score,
+             length) = cls.text.unpack_from(data, offset)
+            offset = offset + cls.text.size
+            opts = {
+                'spacing': spacing,
+                'just-x': cls.justifications[just_x],
+                'just-y': cls.justifications[just_y]}
+            if fonts:
+                text = fonts.pop()
+                text.remove = False
+                (text.pos, text.size) = (Vector2(x, y), Vector2(width, height))
+                text.opts.update(opts)
+                text.invalidate()
+            else:
+                text = Font(Vector2(x, y), Vector2(width, height), opts)
+            text.color = [r, g, b]
+            text.set_string(bytes(data[offset:offset + length]).decode('ascii'))
+            text.update(0, game.bounds)
+            offset = offset + length
+            if is_score:
+                game.score_text = text
+            game.add_item(text)
 
-    def _type(self, obj):
-        return obj.__class__.__name__
+
+class Weapon():
+    # How the ship fires. fire_rate is how many shots a second it fires while the fire
+    #  key is held (None to fire once per press), and at most max_bullets can be flying
+    #  at once.
+    def __init__(self, fire_rate = None, max_bullets = 1):
+        self.fire_rate = fire_rate
+        self.max_bullets = max_bullets
 
 
 class Game():
     # game logic/event handling class
-    def __init__(self, window):
-        self._init_window(window)
-        self._init_opengl()
+    # Pass a window to play, or leave it out to run a headless simulation that is
+    #  advanced manually with step(). Headless games take their size from bounds
+    #  (a WorldBounds), which defaults to the size of a default pyglet window.
+    # With meteor_store, meteors are updated all at once through a MeteorStore
+    #  (only if numpy is available, otherwise they update themselves as usual).
+    # With instanced_meteors, meteors are drawn by a MeteorRenderer (if the
+    #  hardware supports it, otherwise they are drawn like everything else).
+    # With continuous, bullets are tested against meteors along their whole path each
+    #  step, and only hit the first meteor in their way.
+    # weapon is how the ship fires (a Weapon, one bullet at a time if not given). If it
+    #  allows more than one bullet, the game is continuous and numpy is available, all
+    #  bullets are tested against the meteors at once (see _collide_bullets_batched).
+    # All randomness comes from self.random, seeded with seed (a random one if not given).
+    # With profile, the phases of every frame are timed (see stats). A frame is an
+    #  update() in a window, and a step() in a headless game.
+    def __init__(self, window = None, bounds = None, meteor_store = False,
+                 instanced_meteors = False, seed = None, continuous = False, weapon = None,
+                 profile = True):
+        self.window = window
+        self.continuous = continuous
+        self.weapon = weapon or Weapon()
+        self.batched_bullets = (numpy != None and continuous and
+                                self.weapon.max_bullets > 1)
+        # whether the fire key is held, and how long until the next shot
+        self.firing = False
+        self.fire_cooldown = 0.0
+        if seed == None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        self.random = random.Random(seed)
+        if bounds:
+            self.bounds = bounds
+        elif window:
+            self.bounds = window
+        else:
+            self.bounds = WorldBounds(640, 480)
+        self.meteor_renderer = None
+        if self.window:
+            self._init_window()
+            self._init_opengl()
+            if instanced_meteors and MeteorRenderer.supported():
+                self.meteor_renderer = MeteorRenderer()
+        self._init_pools()
+        self._init_object_pools()
         self._init_collider()
-        
-        # list to hold all game objects
-        self.items = []
+        self.meteor_store = None
+        if meteor_store and numpy:
+            self.meteor_store = MeteorStore()
 
-        # set the initial score and level
+        # set the initial score and level. the score and level a game ended with are
+        #  kept in last_score and last_level
         self.score = 0
         self.level = 1
+        self.last_score = 0
+        self.last_level = 0
+        # the text showing the score, once there is one
+        self.score_text = None
+
+        # update() advances the simulation in steps of fixed_dt, as many as the time
+        #  that passed calls for but at most max_steps at once (after a long frame the
+        #  game slows down rather than jumping). time left over is kept for the next
+        #  update, and drawing interpolates that far past the last step
+        self.fixed_dt = 1.0 / 60
+        self.max_steps = 5
+        self.accumulator = 0.0
+        # how many steps have been run
+        self.steps = 0
+
+        # InputRecording being recorded, or Replay being played back
+        self.recording = None
+        self.replaying = None
+
+        # times every frame. the hud shows the numbers on screen
+        self.profiler = FrameProfiler(enabled = profile)
+        self.hud = []
+        self.hud_refresh = 30
 
         # set the initial state (start screen)
         self._init_start()
 
     # misc initializers
 
-    def _init_window(self, window):
-        self.window = window
+    def _init_window(self):
         self.window.clear()
         self.window.flip()
         self.window.set_visible(True)
@@ -727,32 +2256,69 @@ class Game():
             glEnable(GL_LINE_SMOOTH)
             self._aa = True
 
+    def _init_pools(self):
+        # the game objects, in a pool for each kind. the pools are updated and drawn
+        #  in this order
+        self.texts = EntityStore(Font)
+        self.ships = EntityStore(Ship)
+        self.bullets = EntityStore(Bullet)
+        self.meteors1 = EntityStore(Meteor1)
+        self.meteors2 = EntityStore(Meteor2)
+        self.meteors3 = EntityStore(Meteor3)
+        self.meteor_pools = [self.meteors1, self.meteors2, self.meteors3]
+        self.pools = [self.texts, self.ships, self.bullets] + self.meteor_pools
+        # class => pool, filled in for subclasses on first use (see _pool)
+        self.pool_for = dict()
+        for pool in self.pools:
+            self.pool_for[pool.kind] = pool
+            if self.window and not (self.meteor_renderer and pool in self.meteor_pools):
+                pool.batch = pyglet.graphics.Batch()
+
+    def _init_object_pools(self):
+        # dead bullets and meteors to reuse, enough for a few levels' worth of
+        #  split meteors. the outlines they are made with are replaced when used, so
+        #  they come from a throwaway rng rather than the game's (or the random module)
+        rng = random.Random(0)
+        self.object_pools = {
+            Bullet: ObjectPool(Bullet, 4, Vector2(0, 0), 0),
+            Meteor1: ObjectPool(Meteor1, 4, Vector2(0, 0), 0, rng),
+            Meteor2: ObjectPool(Meteor2, 12, Vector2(0, 0), 0, rng),
+            Meteor3: ObjectPool(Meteor3, 36, Vector2(0, 0), 0, rng)}
+
     def _init_collider(self):
         self.collider = Collider()
         self.collider.register_methods(
             self._cd_ship_meteor,
             self._ch_ship_meteor,
-            'Ship', 'Meteor1')
-        self.collider.register_methods(
-            self._cd_ship_meteor,
-            self._ch_ship_meteor,
-            'Ship', 'Meteor2')
+            Ship, Meteor)
+        bullet_detector = self._cd_bullet_meteor
+        if self.continuous:
+            bullet_detector = self._toi_bullet_meteor
         self.collider.register_methods(
-            self._cd_ship_meteor,
-            self._ch_ship_meteor,
-            'Ship', 'Meteor3')
-        self.collider.register_methods(
-            self._cd_bullet_meteor,
+            bullet_detector,
             self._ch_bullet_meteor1,
-            'Bullet', 'Meteor1')
+            Bullet, Meteor1)
         self.collider.register_methods(
-            self._cd_bullet_meteor,
+            bullet_detector,
             self._ch_bullet_meteor2,
-            'Bullet', 'Meteor2')
+            Bullet, Meteor2)
         self.collider.register_methods(
-            self._cd_bullet_meteor,
+            bullet_detector,
             self._ch_bullet_meteor3,
-            'Bullet', 'Meteor3')
+            Bullet, Meteor3)
+        # the pairs of pools that can collide, with the methods for them, and a
+        #  broadphase grid for each pool that others are tested against.
+        # detectors returning a time of impact (_toi_*) instead of true/false only
+        #  count the earliest hit of each object of the first pool
+        self.collisions = []
+        self.broadphases = dict()
+        kinds = [pool.kind for pool in self.pools]
+        for (kind1, kind2, detector, handler) in self.collider.interactions(kinds):
+            (pool1, pool2) = (self.pool_for[kind1], self.pool_for[kind2])
+            first = detector == self._toi_bullet_meteor
+            self.collisions.append((pool1, pool2, detector, first))
+            if pool2 not in self.broadphases:
+                self.broadphases[pool2] = SpatialHash(100)
 
     # state initializers
     
@@ -760,7 +2326,7 @@ class Game():
         # initialize the start screen
         self.state = STATE.start
         self.remove_all_items()
-        (winx, winy) = self.window.get_size()
+        (winx, winy) = self.bounds.get_size()
         s1 = Font(
             Vector2(winx / 2, winy / 2), 
             Vector2(20, 30), 
@@ -793,7 +2359,7 @@ class Game():
         self.level = self.level + 1
         self.state = STATE.level
         self.remove_all_items()
-        (winx, winy) = self.window.get_size()
+        (winx, winy) = self.bounds.get_size()
         s = Font(
             Vector2(winx / 2, winy / 2), 
             Vector2(20, 30), 
@@ -806,9 +2372,7 @@ class Game():
     def _init_play(self):
         # initialize the game
         self.remove_all_items()
-        self.meteors = []
-        self.bullet = None
-        (winx, winy) = self.window.get_size()
+        (winx, winy) = self.bounds.get_size()
         self.score_text = Font(
             Vector2(5, winy - 5), 
             Vector2(10, 15), 
@@ -822,11 +2386,13 @@ class Game():
 
     def _init_game_over(self):
         # initialize the game over screen
+        self.last_score = self.score
+        self.last_level = self.level
         self.level = 1
         self.score = 0
         self.remove_all_items()
         self.state = STATE.game_over
-        (winx, winy) = self.window.get_size()
+        (winx, winy) = self.bounds.get_size()
         s = Font(
             Vector2(winx / 2, winy / 2), 
             Vector2(20, 30), 
@@ -840,15 +2406,119 @@ class Game():
     # helpers
 
     def add_item(self, item):
-        self.items.append(item)
+        # adds item to the pool for its kind
+        pool = self._pool(item)
+        pool.add(item)
+        if pool.batch:
+            item.attach(pool.batch)
+        if self.meteor_store and pool in self.meteor_pools:
+            self.meteor_store.add(item)
 
     def remove_item(self, item):
-        self.items.remove(item)
-        if item == self.bullet:
-            self.bullet = None
+        # removes item right away. during an update, discard items instead
+        self._pool(item).remove(item)
+        self._forget_item(item)
+
+    def _forget_item(self, item):
+        item.detach()
+        if isinstance(item, Meteor) and item.store:
+            item.store.remove(item)
+        if item.__class__ in self.object_pools:
+            self.object_pools[item.__class__].put(item)
 
     def remove_all_items(self):
-        self.items = []
+        if self.meteor_store:
+            self.meteor_store.clear()
+        for pool in self.pools:
+            for item in pool:
+                item.detach()
+                if item.__class__ in self.object_pools:
+                    self.object_pools[item.__class__].put(item)
+            pool.clear()
+
+    def _pool(self, item):
+        # the pool for item's class, or for the closest base class that has one
+        cls = item.__class__
+        if cls not in self.pool_for:
+            for base in inspect.getmro(cls):
+                if base in self.pool_for:
+                    self.pool_for[cls] = self.pool_for[base]
+                    break
+            else:
+                raise ValueError('No pool for %s' % cls.__name__)
+        return self.pool_for[cls]
+
+    def count_meteors(self):
+        return sum(len(pool) for pool in self.meteor_pools)
+
+    def stats(self):
+        # frame timings, see FrameProfiler.stats
+        return self.profiler.stats()
+
+    def _toggle_hud(self):
+        # shows or hides the frame timings, turning on the profiler if it was off
+        if self.hud:
+            for font in self.hud:
+                font.detach()
+            self.hud = []
+            return
+        self.profiler.enabled = True
+        (winx, winy) = self.bounds.get_size()
+        for i in range(len(FrameProfiler.phases) + 2):
+            font = Font(
+                Vector2(winx - 5, winy - 5 - i * 13),
+                Vector2(6, 9),
+                {'just-x' : 'right',
+                 'just-y' : 'top',
+                 'spacing': 0.3})
+            font.color = [0.7, 0.7, 0.7]
+            if self.texts.batch:
+                font.attach(self.texts.batch)
+            self.hud.append(font)
+        self._update_hud()
+
+    def _update_hud(self):
+        # times are in microseconds, font has no decimal point
+        stats = self.stats()
+        lines = ['AVG MAX WORST US']
+        for phase in FrameProfiler.phases + ('frame',):
+            lines.append('%s %d %d %d' % (
+                phase.upper(),
+                stats[phase]['average'] * 1e6,
+                stats[phase]['max'] * 1e6,
+                stats['worst'].get(phase, 0) * 1e6))
+        for (font, line) in zip(self.hud, lines):
+            font.set_string(line)
+            font.update(0, self.bounds)
+
+    def record(self):
+        # starts recording the input, returns the InputRecording.
+        # start before anything happens in the game, to be able to play it back
+        self.recording = InputRecording(self.seed, self.fixed_dt, self.weapon,
+                                        self.continuous)
+        return self.recording
+
+    def replay(self, recording):
+        # plays back a recording. the game must not have been started yet, and must
+        #  have the weapon and collision mode it was recorded with
+        (weapon, played) = (recording.weapon, self.weapon)
+        if ((weapon.fire_rate, weapon.max_bullets, recording.continuous) !=
+                (played.fire_rate, played.max_bullets, self.continuous)):
+            raise ValueError('the recording was made with another weapon or collision mode')
+        self.random = random.Random(recording.seed)
+        self.seed = recording.seed
+        self.fixed_dt = recording.fixed_dt
+        self.replaying = Replay(recording)
+        return self.replaying
+
+    def snapshot(self):
+        # the state of the game between steps, as a compact binary buffer (see Snapshot)
+        return Snapshot.capture(self)
+
+    def restore(self, snapshot):
+        # goes back to the state in snapshot (from snapshot(), of this game or one made
+        #  with the same bounds and options)
+        Snapshot.restore(self, snapshot)
 
     def add_to_score(self, num):
         self.score = self.score + num * self.level
@@ -857,27 +2527,39 @@ class Game():
     # game object initializers
 
     def add_ship(self):
-        (winx, winy) = self.window.get_size()
+        (winx, winy) = self.bounds.get_size()
         pos = Vector2(winx / 2, winy / 2)
         self.ship = Ship(pos)
         self.add_item(self.ship)
 
     def add_bullet(self):
-        if self.bullet == None:
-            pos = self.ship.pos + self.ship.deg_to_vel(self.ship.deg) * self.ship.size.y / 2
-            self.bullet = Bullet(pos, self.ship.deg)
-            self.add_item(self.bullet)
+        if len(self.bullets) < self.weapon.max_bullets:
+            pos = self.ship.pos.copy()
+            pos.add_scaled(self.ship.deg_to_vel(self.ship.deg), self.ship.size.y / 2)
+            self.add_item(self.object_pools[Bullet].get(pos, self.ship.deg))
+        if self.weapon.fire_rate:
+            self.fire_cooldown = 1.0 / self.weapon.fire_rate
+
+    def _fire(self, frame_time):
+        # keeps firing while the fire key is held, if the weapon does that
+        if not (self.firing and self.weapon.fire_rate):
+            return
+        self.fire_cooldown = self.fire_cooldown - frame_time
+        while self.fire_cooldown <= 0:
+            cooldown = self.fire_cooldown
+            self.add_bullet()
+            self.fire_cooldown = self.fire_cooldown + cooldown
 
     def add_meteor1(self):
         # adds large meteors in random locations, with random directions.
         # makes sure it's far enough away from the ship, and from each other
-        (winx, winy) = self.window.get_size()
+        (winx, winy) = self.bounds.get_size()
         count = self.level
         last_poses = []
         for i in range(count):
             search = True
             while search:
-                pos = Vector2(random.uniform(0, winx), random.uniform(0, winy))
+                pos = Vector2(self.random.uniform(0, winx), self.random.uniform(0, winy))
                 search = False
                 for last_pos in last_poses:
                     if abs(pos - last_pos) < 20000:
@@ -886,10 +2568,9 @@ class Game():
                 if abs(pos - self.ship.pos) < 20000:
                     search = True
             last_poses.append(pos)
-            deg = random.uniform(0, 360)
-            m = Meteor1(pos, deg)
+            deg = self.random.uniform(0, 360)
+            m = self.object_pools[Meteor1].get(pos, deg, self.random)
             self.add_item(m)
-            self.meteors.append(m)
 
     def add_meteor2(self, pos):
         # adds meteor2s where a meteor1 was exploded (pos)
@@ -900,16 +2581,15 @@ class Game():
         for i in range(count):
             search = True
             while search:
-                deg = random.uniform(0, 360)
+                deg = self.random.uniform(0, 360)
                 search = False
                 for last_deg in last_degs:
                     if abs(deg - last_deg) < min_separation:
                         search = True
                         break
             last_degs.append(deg)
-            m = Meteor2(pos, deg)
+            m = self.object_pools[Meteor2].get(pos, deg, self.random)
             self.add_item(m)
-            self.meteors.append(m)
 
     def add_meteor3(self, pos):
         # adds meteor2s where an meteor1 was exploded (pos)
@@ -920,20 +2600,22 @@ class Game():
         for i in range(count):
             search = True
             while search:
-                deg = random.uniform(0, 360)
+                deg = self.random.uniform(0, 360)
                 search = False
                 for last_deg in last_degs:
                     if abs(deg - last_deg) < min_separation:
                         search = True
                         break
             last_degs.append(deg)
-            m = Meteor3(pos, deg)
+            m = self.object_pools[Meteor3].get(pos, deg, self.random)
             self.add_item(m)
-            self.meteors.append(m)
 
     # keyboard event handler
 
     def on_key(self, symbol, modifiers, press):
+        if self.recording:
+            self.recording.record(self.steps, self.steps * self.fixed_dt + self.accumulator,
+                                  symbol, modifiers, press)
         if symbol == key.ENTER and press:
             if self.state == STATE.start:
                 self._init_play()
@@ -953,41 +2635,264 @@ class Game():
         elif symbol == key.DOWN:
             if self.state == STATE.play:
                 self.ship.thrust(THRUST.back, press)
-        elif (symbol == key.SPACE or symbol == key.S) and press:
-            if self.state == STATE.play:
+        elif symbol == key.SPACE or symbol == key.S:
+            self.firing = press
+            if press and self.state == STATE.play:
                 self.add_bullet()
         elif symbol == key.A and press:
-            self._toggle_aa()
+            if self.window:
+                self._toggle_aa()
+        elif symbol == key.P and press:
+            self._toggle_hud()
 
     # render event handler
 
     def draw(self):
+        if not self.window:
+            return
+        self.profiler.start('draw')
         self.window.clear()
-        for item in self.items:
+        alpha = self.accumulator / self.fixed_dt
+        debugging = []
+        for pool in self.pools:
+            for item in pool:
+                item.sync_vertices(alpha, self.bounds)
+                if item.debugging():
+                    debugging.append(item)
+        for font in self.hud:
+            font.sync_vertices()
+        glLoadIdentity()
+        if self.meteor_store and self.meteor_renderer:
+            self.meteor_renderer.draw_store(self.meteor_store, alpha, self.bounds)
+        elif self.meteor_renderer:
+            meteors = []
+            for pool in self.meteor_pools:
+                meteors.extend(pool)
+            self.meteor_renderer.draw(meteors, alpha, self.bounds)
+        for pool in self.pools:
+            if pool.batch:
+                pool.batch.draw()
+        for item in debugging:
             item.draw()
+        self.profiler.stop('draw')
 
     # update event handler
 
     def update(self, frame_time):
+        # runs the fixed steps for frame_time seconds passing
+        if self.window:
+            self.profiler.next_frame()
+        if self.hud and self.profiler.frames % self.hud_refresh == 0:
+            self._update_hud()
+        self.accumulator = min(self.accumulator + frame_time, self.max_steps * self.fixed_dt)
+        while self.accumulator >= self.fixed_dt:
+            self.step(self.fixed_dt)
+            self.accumulator = self.accumulator - self.fixed_dt
+
+    def step(self, frame_time):
+        # advance the simulation by frame_time seconds. headless games call this
+        #  directly, as often and with whatever time they like.
+        if self.replaying:
+            self.replaying.play(self)
+        self.steps = self.steps + 1
+        self.update_items(frame_time)
+        if self.state == STATE.play:
+            self.collide_items()
+        self.remove_items()
+        if not self.window:
+            self.profiler.next_frame()
+
+    def update_items(self, frame_time):
         # update game objects
-        for item in self.items:
-            if item.remove:
-                self.remove_item(item)
-                if item == self.ship:
-                    self._init_game_over()
+        self.profiler.start('update')
+        if self.state == STATE.play:
+            self._fire(frame_time)
+        if self.meteor_store:
+            self.meteor_store.update(frame_time, self.bounds)
+        for pool in self.pools:
+            if pool is self.bullets and self.batched_bullets:
+                self._update_bullets_batched(frame_time)
+                continue
+            for item in pool:
+                if not item.remove:
+                    item.update(frame_time, self.bounds)
+                if item.remove:
+                    pool.discard(item)
+        self.profiler.stop('update')
+
+    def _update_bullets_batched(self, frame_time):
+        # Bullet.update for all bullets at once
+        bullets = [bullet for bullet in self.bullets if not bullet.remove]
+        for bullet in self.bullets:
+            if bullet.remove:
+                self.bullets.discard(bullet)
+        if not bullets:
+            return
+        pos = numpy.array([(bullet.pos.x, bullet.pos.y) for bullet in bullets])
+        vel = numpy.array([(bullet.vel.x, bullet.vel.y) for bullet in bullets])
+        pos += vel * frame_time
+        (winx, winy) = self.bounds.get_size()
+        off = (pos[:, 0] < 0) | (pos[:, 0] > winx) | (pos[:, 1] < 0) | (pos[:, 1] > winy)
+        for (i, bullet) in enumerate(bullets):
+            bullet.update_pos(Vector2(float(pos[i, 0]), float(pos[i, 1])))
+            if off[i]:
+                bullet.remove = True
+                self.bullets.discard(bullet)
+
+    def collide_items(self):
+        # check for collisions, but only between objects that are near each other
+        #  and of types that can collide at all
+        self.profiler.start('broadphase')
+        for (pool, broadphase) in self.broadphases.items():
+            broadphase.clear(self.bounds)
+            for item in pool:
+                if not item.remove:
+                    broadphase.insert(item, item.broadphase_circle())
+        pairs = []
+        for (pool1, pool2, detector, first) in self.collisions:
+            if pool1 is self.bullets and self.batched_bullets:
+                continue
+            broadphase = self.broadphases[pool2]
+            for item1 in pool1:
+                if item1.remove:
+                    continue
+                for item2 in broadphase.query(item1.broadphase_circle()):
+                    pairs.append((item1, item2, pool1, pool2, detector, first))
+        self.profiler.stop('broadphase')
+        self.profiler.start('narrowphase')
+        # item1 => (time of impact, index, pair) of its earliest hit. on a tie the
+        #  pair found first wins. the hits are then handled in order of time, then of
+        #  item1's pool and slot (as _collide_bullets_batched does)
+        earliest = dict()
+        for (index, pair) in enumerate(pairs):
+            (item1, item2, pool1, pool2, detector, first) = pair
+            if item1.remove or item2.remove:
+                continue
+            if first:
+                time = detector(item1, item2)
+                if time != None and (item1 not in earliest or time < earliest[item1][0]):
+                    earliest[item1] = (time, index, pair)
             else:
-                item.update(frame_time, self.window)
-        # check for collisions
+                self._handle(pair, False)
+        order = lambda hit: (hit[0], self.pools.index(hit[2][2]), hit[2][0].slot)
+        for (time, index, pair) in sorted(earliest.values(), key = order):
+            if not (pair[0].remove or pair[1].remove):
+                self._handle(pair)
+        if self.batched_bullets:
+            self._collide_bullets_batched()
+        self.profiler.stop('narrowphase')
+
+    def _collide_bullets_batched(self):
+        # Tests every bullet against every meteor at once, along the bullets' paths
+        #  this step (relative to the meteors, as in _toi_bullet_meteor): first
+        #  against the meteors' bounding circles, then, for the pairs that hit, against
+        #  their outlines. Each bullet hits the first meteor in its way (on a tie, the
+        #  one first in the pools). The hits are then handled in order of when they
+        #  happened, then of the bullets' slots. A bullet whose meteor was already
+        #  destroyed by an earlier hit misses
+        bullets = [bullet for bullet in self.bullets if not bullet.remove]
+        pools = []
+        meteors = []
+        for (pool1, pool2, detector, first) in self.collisions:
+            if pool1 is self.bullets:
+                for meteor in pool2:
+                    if not meteor.remove:
+                        meteors.append(meteor)
+                        pools.append(pool2)
+        if not bullets or not meteors:
+            return
+        m = len(meteors)
+        starts = numpy.array([(b.last_pos[0].x, b.last_pos[0].y) for b in bullets])
+        ends = numpy.array([(b.pos.x, b.pos.y) for b in bullets])
+        centers = numpy.empty((m, 2))
+        moved = numpy.zeros((m, 2))
+        radius = numpy.empty(m)
+        size = numpy.empty(m)
+        rad = numpy.empty(m)
+        max_points = max(meteor.outline.num_points for meteor in meteors)
+        edge_starts = numpy.full((m, max_points, 2), numpy.nan)
+        edge_ends = numpy.full((m, max_points, 2), numpy.nan)
+        for (j, meteor) in enumerate(meteors):
+            (pos, deg) = (meteor.pos, meteor.deg)
+            centers[j] = (pos.x, pos.y)
+            radius[j] = meteor.bounding_circle().radius
+            size[j] = meteor.size.x
+            rad[j] = math.radians(deg)
+            previous = meteor.previous_state()
+            if previous:
+                (dx, dy) = (pos.x - previous[0].x, pos.y - previous[0].y)
+                if abs(dx) < meteor.size.x and abs(dy) < meteor.size.y:
+                    moved[j] = (dx, dy)
+            (shape_starts, shape_ends) = meteor.outline.edge_arrays()
+            edge_starts[j, :len(shape_starts)] = shape_starts
+            edge_ends[j, :len(shape_ends)] = shape_ends
+
+        # against the bounding circles, for all bullet, meteor pairs
+        start = starts[:, None, :] + moved[None, :, :]
+        touch = sweep_circles(start, ends[:, None, :], centers[None, :, :], radius[None, :])
+        (bi, mj) = numpy.nonzero(touch)
+        if len(bi) == 0:
+            return
+
+        # the candidate paths in the unit space of their meteors (Meteor.to_local)
+        (sin, cos) = (numpy.sin(rad[mj]), numpy.cos(rad[mj]))
+        local = []
+        for points in (start[bi, mj], ends[bi]):
+            dx = points[:, 0] - centers[mj, 0]
+            dy = points[:, 1] - centers[mj, 1]
+            local.append(numpy.stack([(dx * cos + dy * sin) / size[mj] + 0.5,
+                                      (dy * cos - dx * sin) / size[mj] + 0.5], axis = 1))
+        (p, q) = local
+        time = sweep_outlines(p, q, edge_starts[mj], edge_ends[mj])
+
+        # the first hit of each bullet
+        found = numpy.isfinite(time)
+        (bi, mj, time) = (bi[found], mj[found], time[found])
+        order = numpy.lexsort((mj, time, bi))
+        (bi, mj, time) = (bi[order], mj[order], time[order])
+        first = numpy.ones(len(bi), dtype = bool)
+        first[1:] = bi[1:] != bi[:-1]
+        (bi, mj, time) = (bi[first], mj[first], time[first])
+        for k in numpy.lexsort((bi, time)):
+            (bullet, meteor) = (bullets[bi[k]], meteors[mj[k]])
+            if bullet.remove or meteor.remove:
+                continue
+            self._handle((bullet, meteor, self.bullets, pools[mj[k]], None, True))
+
+    def _handle(self, pair, detected = True):
+        # runs a pair through the collider (testing it first, unless it's already known
+        #  to have collided), and discards what the collision destroyed. returns true
+        #  if they collided
+        (item1, item2, pool1, pool2) = pair[:4]
+        if not self.collider.collide_and_handle(item1, item2, detected):
+            return False
+        if item1.remove:
+            pool1.discard(item1)
+        if item2.remove:
+            pool2.discard(item2)
+        return True
+
+    def remove_items(self):
+        # removes the objects discarded during the update and collisions, then
+        #  moves on to the next screen if the ship died or all meteors are gone
+        self.profiler.start('removal')
+        removed = []
+        for pool in self.pools:
+            removed.extend(pool.compact())
+        for item in removed:
+            self._forget_item(item)
         if self.state == STATE.play:
-            for item1 in self.items:
-                for item2 in self.items:
-                    if item1 != item2:
-                        if self.collider.collide(item1, item2):
-                            self.collider.handle(item1, item2)
+            if self.ship in removed:
+                self._init_game_over()
+            elif self.count_meteors() == 0:
+                self._init_level()
+        self.profiler.stop('removal')
 
     # collision detection methods (these could live anywhere really since they are purely functional)
 
     def _cd_ship_meteor(self, ship, meteor):
+        if numpy:
+            return self._cd_ship_meteor_batched(ship, meteor)
         ship_points = ship.get_all_points_transformed()
         for ship_point_index in range(len(ship_points)):
             ship_point = ship_points[ship_point_index]
@@ -999,14 +2904,50 @@ class Game():
                         return True
         return False
 
+    def _cd_ship_meteor_batched(self, ship, meteor):
+        # same as _cd_ship_meteor, but tests all the paths of the ship points that are
+        #  inside the meteor against all of its edges at once
+        ship_points = ship.get_point_array()
+        circle = meteor.bounding_circle()
+        offset = ship_points - (circle.center.x, circle.center.y)
+        inside = (offset ** 2).sum(axis = 1) < circle.radius * circle.radius
+        if not inside.any():
+            return False
+        ship_points_old = ship.get_point_array(2)
+        (edge_starts, edge_ends) = meteor.get_edge_arrays()
+        (hits, contact) = intersect_segments(
+            ship_points_old[inside], ship_points[inside], edge_starts, edge_ends)
+        return bool(hits.any())
+
     def _cd_bullet_meteor(self, bullet, meteor):
         if meteor.bounding_circle().inside(bullet.pos):
+            if numpy:
+                (start, end) = (bullet.last_pos[1], bullet.pos)
+                (edge_starts, edge_ends) = meteor.get_edge_arrays()
+                (hits, contact) = intersect_segments(
+                    numpy.array([[start.x, start.y]]), numpy.array([[end.x, end.y]]),
+                    edge_starts, edge_ends)
+                return bool(hits.any())
             line1 = Line(bullet.last_pos[1], bullet.pos)
             for line2 in meteor.get_lines():
                 if line1.intersect(line2):
                     return True
         return False
 
+    def _toi_bullet_meteor(self, bullet, meteor):
+        # continuous version of _cd_bullet_meteor: returns how far along its path this
+        #  step (0 to 1) the bullet hits the meteor, or None if it doesn't.
+        # the path is taken relative to the meteor, which moves too (unless it just
+        #  wrapped around the world)
+        (start, end) = (bullet.last_pos[0], bullet.pos)
+        previous = meteor.previous_state()
+        if previous:
+            pos = meteor.pos
+            (dx, dy) = (pos.x - previous[0].x, pos.y - previous[0].y)
+            if abs(dx) < meteor.size.x and abs(dy) < meteor.size.y:
+                start = Vector2(start.x + dx, start.y + dy)
+        return meteor.time_of_impact(start, end)
+
     # collision handling methods (these have to be here since they affect the game state)
 
     def _ch_ship_meteor(self, ship, meteor):
@@ -1016,7 +2957,6 @@ class Game():
         meteor.hit()
         bullet.hit()
         if meteor.remove:
-            self.meteors.remove(meteor)
             self.add_to_score(25)
             self.add_meteor2(meteor.pos)
 
@@ -1024,7 +2964,6 @@ class Game():
         meteor.hit()
         bullet.hit()
         if meteor.remove:
-            self.meteors.remove(meteor)
             self.add_to_score(50)
             self.add_meteor3(meteor.pos)
 
@@ -1032,30 +2971,47 @@ class Game():
         meteor.hit()
         bullet.hit()
         if meteor.remove:
-            self.meteors.remove(meteor)
             self.add_to_score(100)
-            if len(self.meteors) == 0:
-                self._init_level()
-
-
-window = pyglet.window.Window()
-game = Game(window)
-
-# Event registration
-@window.event
-def on_draw():
-    game.draw()
-
-@window.event
-def on_key_press(symbol, modifiers):
-    game.on_key(symbol, modifiers, True)
-
-@window.event
-def on_key_release(symbol, modifiers):
-    game.on_key(symbol, modifiers, False)
 
-# Register update method @ 60 fps
-pyglet.clock.schedule_interval(game.update, 1.0/60.0)
 
-# start the application
-pyglet.app.run()
+if __name__ == '__main__':
+    # python meteors.py [--rapid] [--record FILE | --replay FILE]
+    if pyglet is None:
+        sys.exit('meteors needs pyglet and a display to be played (%s)' % pyglet_error)
+    window = pyglet.window.Window()
+    weapon = None
+    if '--rapid' in sys.argv:
+        weapon = Weapon(fire_rate = 15, max_bullets = 200)
+    continuous = False
+    if '--replay' in sys.argv:
+        # plays with the weapon the recording was made with
+        replaying = InputRecording.load(sys.argv[sys.argv.index('--replay') + 1])
+        (weapon, continuous) = (replaying.weapon, replaying.continuous)
+    game = Game(window, continuous = continuous, weapon = weapon)
+    if '--record' in sys.argv:
+        recording = game.record()
+    if '--replay' in sys.argv:
+        game.replay(replaying)
+
+    # Event registration
+    @window.event
+    def on_draw():
+        game.draw()
+
+    @window.event
+    def on_key_press(symbol, modifiers):
+        game.on_key(symbol, modifiers, True)
+
+    @window.event
+    def on_key_release(symbol, modifiers):
+        game.on_key(symbol, modifiers, False)
+
+    # Register update method every frame. the game runs its own fixed steps,
+    #  so this can go as fast as the display allows
+    pyglet.clock.schedule(game.update)
+
+    # start the application
+    pyglet.app.run()
+
+    if '--record' in sys.argv:
+        recording.save(sys.argv[sys.argv.index('--record') + 1])
@@ -0,0 +1,220 @@
+# checks that the fast paths of meteors give the same results as the plain ones
+#  they stand in for. each check prints what it compared and how many mismatches it
+#  found, and the script exits with an error if there were any. needs numpy.
+#
+#  segments: intersect_segments against Line.intersect, on random segment pairs
+#            (including zero length, axis aligned and touching ones)
+#  bullets:  _collide_bullets_batched against the per pair _toi_bullet_meteor, step
+#            by step from the same state, on random fields of meteors shot at with
+#            a rapid fire weapon
+#  vecgame:  VectorGame against Game(continuous = True), with the same seeds and
+#            random actions, until each game first ends, with 1 and 3 bullets
+#
+# python parity.py [--check NAME ...] [--seed N]
+
+import argparse
+import random
+import sys
+
+import pyglet
+pyglet.options['headless'] = True
+
+import numpy
+
+import meteors
+from meteors import key, STATE, Vector2
+from vecgame import VectorGame
+
+
+def random_segment(rng):
+    # a segment on a small grid, so ends and slopes often coincide
+    kind = rng.random()
+    (x, y) = (rng.randint(-10, 10) / 2.0, rng.randint(-10, 10) / 2.0)
+    if kind < 0.05:
+        return ((x, y), (x, y))
+    if kind < 0.2:
+        return ((x, y), (x, y + rng.randint(-10, 10) / 2.0))
+    if kind < 0.35:
+        return ((x, y), (x + rng.randint(-10, 10) / 2.0, y))
+    if kind < 0.6:
+        return ((x, y), (rng.randint(-10, 10) / 2.0, rng.randint(-10, 10) / 2.0))
+    return ((x, y), (rng.uniform(-5, 5), rng.uniform(-5, 5)))
+
+
+def check_segments(seed):
+    rng = random.Random(seed)
+    (count, mismatches) = (0, 0)
+    for batch in range(150):
+        segments = [random_segment(rng) for i in range(15)]
+        edges = [random_segment(rng) for i in range(20)]
+        (hits, contact) = meteors.intersect_segments(
+            [start for (start, end) in segments], [end for (start, end) in segments],
+            [start for (start, end) in edges], [end for (start, end) in edges])
+        for (i, (start, end)) in enumerate(segments):
+            for (j, (edge_start, edge_end)) in enumerate(edges):
+                line1 = meteors.Line(Vector2(*start), Vector2(*end))
+                line2 = meteors.Line(Vector2(*edge_start), Vector2(*edge_end))
+                count = count + 1
+                if bool(hits[i, j]) != line1.intersect(line2):
+                    mismatches = mismatches + 1
+    return {'pairs': count, 'mismatches': mismatches}
+
+
+class HitGame(meteors.Game):
+    # a Game that keeps the hits of its last step, as (meteor pool, meteor slot,
+    #  bullet slot), in the order they were handled
+    hits = []
+
+    def step(self, frame_time):
+        self.hits = []
+        meteors.Game.step(self, frame_time)
+
+    def _handle(self, pair, detected = True):
+        (item1, item2) = pair[:2]
+        # the slots, before the collision can discard them
+        slots = (item2.slot, item1.slot)
+        collided = meteors.Game._handle(self, pair, detected)
+        if collided and isinstance(item1, meteors.Bullet):
+            self.hits.append((self.meteor_pools.index(self._pool(item2)),) + slots)
+        return collided
+
+
+def check_bullets(seed):
+    # a spinning ship shoots at a field of meteors. before every step, the state of
+    #  the batched game is copied into one using the per pair path, and both run the
+    #  step. they have to make the same hits. (the order the hits are handled in
+    #  differs, so meteors destroyed in the same step can split in a different order,
+    #  which is why the games aren't just run side by side)
+    bounds = meteors.WorldBounds(1024, 768)
+    weapon = meteors.Weapon(30, 200)
+    (fields, steps, hits, mismatches) = (40, 0, 0, 0)
+    for field in range(fields):
+        game = HitGame(bounds = bounds, seed = seed + field, continuous = True,
+                       weapon = weapon, profile = False)
+        plain = HitGame(bounds = bounds, continuous = True, weapon = weapon, profile = False)
+        plain.batched_bullets = False
+        game.on_key(key.ENTER, 0, True)
+        for meteor_class in (meteors.Meteor1, meteors.Meteor2, meteors.Meteor3):
+            for i in range(10):
+                pos = Vector2(game.random.uniform(0, 1024), game.random.uniform(0, 768))
+                game.add_item(meteor_class(pos, game.random.uniform(0, 360), game.random))
+        game.on_key(key.LEFT, 0, True)
+        game.on_key(key.SPACE, 0, True)
+        plain.on_key(key.LEFT, 0, True)
+        plain.on_key(key.SPACE, 0, True)
+        for step in range(240):
+            if game.state != STATE.play:
+                break
+            plain.restore(game.snapshot())
+            game.step(game.fixed_dt)
+            plain.step(plain.fixed_dt)
+            steps = steps + 1
+            hits = hits + len(game.hits)
+            if sorted(game.hits) != sorted(plain.hits) or game.score != plain.score:
+                mismatches = mismatches + 1
+    return {'fields': fields, 'steps': steps, 'hits': hits, 'mismatches': mismatches}
+
+
+def check_vecgame(seed):
+    # with one bullet at a time, and with more (which Game handles batched)
+    results = [compare_vecgame(seed, 1), compare_vecgame(seed, 3)]
+    total = dict((field, sum(result[field] for result in results))
+                 for field in ('games', 'steps', 'mismatches'))
+    total['max_error'] = max(result['max_error'] for result in results)
+    return total
+
+
+def compare_vecgame(seed, max_bullets):
+    count = 8
+    games = VectorGame(count, seeds = range(seed, seed + count), max_bullets = max_bullets)
+    games.reset()
+    weapon = meteors.Weapon(None, max_bullets)
+    plain = []
+    for i in range(count):
+        game = meteors.Game(seed = seed + i, continuous = True, weapon = weapon,
+                            profile = False)
+        game.on_key(key.ENTER, 0, True)
+        plain.append(game)
+    rng = random.Random(seed)
+    live = [True] * count
+    (steps, mismatches, error) = (0, 0, 0.0)
+    for step in range(3000):
+        actions = numpy.zeros((count, 3), dtype = int)
+        for i in range(count):
+            actions[i] = (rng.choice([-1, 0, 0, 1]), rng.choice([-1, 0, 0, 1]),
+                          rng.random() < 0.1)
+        for (i, game) in enumerate(plain):
+            if not live[i]:
+                continue
+            (turn, thrust, fire) = actions[i]
+            # releasing a key stops turning or thrusting either way, so release first
+            for symbol in (key.LEFT, key.RIGHT, key.UP, key.DOWN):
+                game.on_key(symbol, 0, False)
+            if turn:
+                game.on_key({1: key.LEFT, -1: key.RIGHT}[turn], 0, True)
+            if thrust:
+                game.on_key({1: key.UP, -1: key.DOWN}[thrust], 0, True)
+            if fire:
+                game.on_key(key.SPACE, 0, True)
+                game.on_key(key.SPACE, 0, False)
+            game.step(game.fixed_dt)
+            if game.state == STATE.level:
+                game.on_key(key.ENTER, 0, True)
+        (observations, rewards, dones) = games.step(actions)
+        for (i, game) in enumerate(plain):
+            if not live[i]:
+                continue
+            if game.state == STATE.game_over or dones[i]:
+                # both have to end on the same step, with the same score and level
+                live[i] = False
+                if not (game.state == STATE.game_over and dones[i] and
+                        game.last_score == games.last_score[i] and
+                        game.last_level == games.last_level[i]):
+                    mismatches = mismatches + 1
+                continue
+            steps = steps + 1
+            positions = sorted((meteor.pos.x, meteor.pos.y)
+                               for pool in game.meteor_pools for meteor in pool)
+            vector_positions = sorted(map(tuple, games.meteor_pos[i][games.meteor_alive[i]]))
+            if (game.score != games.score[i] or game.level != games.level[i] or
+                    len(positions) != len(vector_positions)):
+                mismatches = mismatches + 1
+                live[i] = False
+                continue
+            if positions:
+                error = max(error, float(numpy.abs(
+                    numpy.array(positions) - numpy.array(vector_positions)).max()))
+            error = max(error, abs(game.ship.pos.x - games.ship_pos[i, 0]),
+                        abs(game.ship.pos.y - games.ship_pos[i, 1]))
+            if error > 1e-6:
+                mismatches = mismatches + 1
+                live[i] = False
+    return {'games': count, 'steps': steps, 'max_error': error, 'mismatches': mismatches}
+
+
+checks = {
+    'segments': check_segments,
+    'bullets': check_bullets,
+    'vecgame': check_vecgame}
+check_order = ['segments', 'bullets', 'vecgame']
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'check the fast paths of meteors')
+    parser.add_argument('--check', action = 'append', choices = check_order,
+                        help = 'run only this check (can be repeated)')
+    parser.add_argument('--seed', type = int, default = 1)
+    args = parser.parse_args()
+
+    failed = False
+    for name in args.check or check_order:
+        result = checks[name](args.seed)
+        sys.stdout.write('%s: %s\n' % (name, ', '.join(
+            '%s %s' % (field, result[field]) for field in sorted(result))))
+        failed = failed or result['mismatches'] > 0
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+# runs many headless games of meteors, spread over a pool of processes (one per cpu
+#  core by default). every game (episode) is seeded, and steered by a policy, which
+#  is called before every step with the game and a random.Random seeded from the
+#  episode's seed, and plays by calling game.on_key. policies are sent to the
+#  worker processes, so they have to be picklable (e.g. functions at module level).
+#  each episode's score, level and steps are printed as a line of json as soon as it
+#  is done, followed by a summary of all of them.
+#
+# python rollout.py [--policy NAME] [--episodes N] [--first-seed N] [--workers N]
+#                   [--max-steps N] [--level N] [--rapid] [--out FILE]
+
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+
+import meteors
+from meteors import clock, key, STATE
+
+
+# policies
+
+def policy_idle(game, rng):
+    # just sits there
+    pass
+
+
+def policy_random(game, rng):
+    # presses and releases keys at random, a few times a second
+    if rng.random() < 0.15:
+        symbol = rng.choice([key.LEFT, key.RIGHT, key.UP, key.SPACE, key.SPACE, key.SPACE])
+        game.on_key(symbol, 0, rng.random() < 0.7)
+
+
+def policy_spin(game, rng):
+    # turns round and round, shooting all the time
+    if game.steps % 10 == 0:
+        game.on_key(key.LEFT, 0, True)
+        game.on_key(key.SPACE, 0, True)
+        game.on_key(key.SPACE, 0, False)
+
+
+policies = {
+    'idle': policy_idle,
+    'random': policy_random,
+    'spin': policy_spin}
+
+
+# running episodes
+
+class Episode():
+    # what to run in a worker: a game with seed, steered by policy until the ship
+    #  dies or max_steps have run, starting at level. weapon is the (fire rate, max
+    #  bullets) of a Weapon, or None for the default one
+    def __init__(self, policy, seed, max_steps = 36000, level = 1, weapon = None):
+        self.policy = policy
+        self.seed = seed
+        self.max_steps = max_steps
+        self.level = level
+        self.weapon = weapon
+
+    def run(self):
+        # plays the episode, returns the results as a dict
+        start = clock()
+        weapon = None
+        if self.weapon:
+            weapon = meteors.Weapon(*self.weapon)
+        game = meteors.Game(seed = self.seed, weapon = weapon, profile = False)
+        rng = random.Random(self.seed)
+        game.level = self.level
+        game.on_key(key.ENTER, 0, True)
+        died = False
+        while game.steps < self.max_steps:
+            self.policy(game, rng)
+            game.step(game.fixed_dt)
+            if game.state == STATE.level:
+                game.on_key(key.ENTER, 0, True)
+            elif game.state == STATE.game_over:
+                died = True
+                break
+        if died:
+            (score, level) = (game.last_score, game.last_level)
+        else:
+            (score, level) = (game.score, game.level)
+        return {
+            'seed': self.seed,
+            'score': score,
+            'level': level,
+            'steps': game.steps,
+            'died': died,
+            'seconds': clock() - start}
+
+
+def run_episode(episode):
+    return episode.run()
+
+
+def rollouts(policy, seeds, workers = None, **options):
+    # runs an Episode(policy, seed, **options) for every seed over a pool of workers
+    #  processes (one per cpu core if not given). yields the results of each as it
+    #  finishes, which is not necessarily in the order of seeds
+    episodes = [Episode(policy, seed, **options) for seed in seeds]
+    pool = multiprocessing.Pool(workers or multiprocessing.cpu_count())
+    try:
+        for result in pool.imap_unordered(run_episode, episodes):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def summary(results, seconds, workers):
+    # totals and throughput of a list of episode results, run in seconds
+    count = max(len(results), 1)
+    steps = sum(result['steps'] for result in results)
+    return {
+        'episodes': len(results),
+        'workers': workers,
+        'seconds': seconds,
+        'steps': steps,
+        'episodes_per_second': len(results) / max(seconds, 1e-9),
+        'steps_per_second': steps / max(seconds, 1e-9),
+        'mean_score': float(sum(result['score'] for result in results)) / count,
+        'max_score': max([result['score'] for result in results] or [0]),
+        'mean_level': float(sum(result['level'] for result in results)) / count,
+        'max_level': max([result['level'] for result in results] or [0]),
+        'mean_steps': float(steps) / count,
+        'died': sum(1 for result in results if result['died'])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'run games of meteors in parallel')
+    parser.add_argument('--policy', choices = sorted(policies), default = 'random')
+    parser.add_argument('--episodes', type = int, default = 64)
+    parser.add_argument('--first-seed', type = int, default = 1)
+    parser.add_argument('--workers', type = int, default = multiprocessing.cpu_count(),
+                        help = 'worker processes (default: one per cpu core)')
+    parser.add_argument('--max-steps', type = int, default = 36000,
+                        help = 'end episodes after this many steps (default: 10 minutes)')
+    parser.add_argument('--level', type = int, default = 1)
+    parser.add_argument('--rapid', action = 'store_true',
+                        help = 'play with a rapid fire weapon')
+    parser.add_argument('--out', help = 'write the json here instead of stdout')
+    args = parser.parse_args()
+
+    weapon = None
+    if args.rapid:
+        weapon = (15, 200)
+    seeds = range(args.first_seed, args.first_seed + args.episodes)
+    out = sys.stdout
+    if args.out:
+        out = open(args.out, 'w')
+    results = []
+    start = clock()
+    for result in rollouts(policies[args.policy], seeds, args.workers,
+                           max_steps = args.max_steps, level = args.level, weapon = weapon):
+        results.append(result)
+        out.write(json.dumps(result, sort_keys = True) + '\n')
+        out.flush()
+    totals = summary(results, clock() - start, args.workers)
+    out.write(json.dumps({'summary': totals}, sort_keys = True) + '\n')
+    if args.out:
+        out.close()
+
+
+if __name__ == '__main__':
+    main()
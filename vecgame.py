@@ -0,0 +1,430 @@
+# Many games of meteors stepped in lockstep, for automated players (requires numpy).
+#
+# A VectorGame holds the state of count independent games in arrays (one row per
+#  game) instead of count Game objects, and steps them all at once from an array of
+#  actions. It plays by the same rules as Game: the same ship, bullets and meteors,
+#  score and levels. Games don't wait on the level and game over screens though, a
+#  cleared level goes straight on to the next one, and a game that is over starts
+#  again right away (and is reported done).
+# Bullets are always tested along their whole path, so with the same seed and input
+#  a game plays out as a Game(continuous = True, weapon = Weapon(None, max_bullets))
+#  does, not as a default Game (parity.py checks this).
+#
+#   games = VectorGame(16, seeds = range(16))
+#   observations = games.reset()
+#   (observations, rewards, dones) = games.step(actions)
+
+import random
+
+import numpy
+
+from meteors import MeteorShapes, WorldBounds, sweep_circles, sweep_outlines
+
+
+# the columns of an action: turn (1 = left, -1 = right), thrust (1 = forward,
+#  -1 = back) and fire (1 = fire, if there is no bullet flying yet)
+TURN = 0
+THRUST = 1
+FIRE = 2
+
+# the meteor tiers, as in Meteor1, Meteor2 and Meteor3
+tier_points = (18, 12, 8)
+tier_size = numpy.array([200.0, 100.0, 40.0])
+tier_speed = numpy.array([40.0, 60.0, 80.0])
+tier_health = numpy.array([6, 4, 2])
+tier_score = numpy.array([25, 50, 100])
+
+# the ship, as in Ship
+ship_size = (20.0, 40.0)
+ship_accel = 300.0
+ship_turn_speed = 200.0
+# the corners of the ship, in unit space
+ship_points = numpy.array([(0.5, 1), (1, 0), (0.5, 0.2), (0, 0)])
+
+bullet_speed = 500.0
+
+
+def direction(deg):
+    # WObject.deg_to_vel for arrays of angles, as an (..., 2) array
+    rad = numpy.radians(deg)
+    return numpy.stack([-numpy.sin(rad), numpy.cos(rad)], axis = -1)
+
+
+class VectorGame():
+    # count games in lockstep. seeds seeds each game's random.Random (as Game's seed
+    #  does), by default they are random. bounds (a WorldBounds) is the size of all
+    #  the worlds, default the size of a default pyglet window.
+    # Observations are a dict of arrays, one row per game:
+    #  'ship'     (count, 5): x, y, x velocity, y velocity, angle
+    #  'meteors'  (count, observed, 6): the observed meteors nearest the ship, nearest
+    #               first, as x and y relative to the ship, x and y velocity, radius
+    #               and 1 (all 0 where there are fewer meteors)
+    #  'bullets'  (count, max_bullets, 5): x, y, x velocity, y velocity, and 1 if the
+    #               bullet is flying
+    #  'score', 'level' (count,)
+    def __init__(self, count, seeds = None, bounds = None, max_bullets = 1,
+                 observed = 8, fixed_dt = 1.0 / 60):
+        self.count = count
+        if seeds == None:
+            seeds = [random.randrange(2 ** 32) for i in range(count)]
+        self.seeds = list(seeds)
+        self.bounds = bounds or WorldBounds(640, 480)
+        self.max_bullets = max_bullets
+        self.observed = observed
+        self.fixed_dt = fixed_dt
+        self._init_shapes()
+
+        n = count
+        self.random = [random.Random(seed) for seed in self.seeds]
+        self.score = numpy.zeros(n, dtype = int)
+        self.level = numpy.ones(n, dtype = int)
+        # steps since each game started
+        self.steps = numpy.zeros(n, dtype = int)
+        # score, level and steps of the last finished game of each
+        self.last_score = numpy.zeros(n, dtype = int)
+        self.last_level = numpy.zeros(n, dtype = int)
+        self.last_steps = numpy.zeros(n, dtype = int)
+
+        # the ship. its position and angle are also kept for 2 steps back, which the
+        #  collision detection sweeps from (as Ship does)
+        self.ship_pos = numpy.zeros((n, 2))
+        self.ship_vel = numpy.zeros((n, 2))
+        self.ship_deg = numpy.zeros(n)
+        self.ship_last_pos = numpy.zeros((n, 2, 2))
+        self.ship_last_deg = numpy.zeros((n, 2))
+
+        # the bullets, and where they were one step back
+        b = max_bullets
+        self.bullet_pos = numpy.zeros((n, b, 2))
+        self.bullet_last_pos = numpy.zeros((n, b, 2))
+        self.bullet_vel = numpy.zeros((n, b, 2))
+        self.bullet_alive = numpy.zeros((n, b), dtype = bool)
+
+        # the meteors. room is made for more as needed (see _grow)
+        self.meteor_pos = numpy.zeros((n, 0, 2))
+        self.meteor_last_pos = numpy.zeros((n, 0, 2))
+        self.meteor_vel = numpy.zeros((n, 0, 2))
+        self.meteor_deg = numpy.zeros((n, 0))
+        self.meteor_turn_speed = numpy.zeros((n, 0))
+        self.meteor_health = numpy.zeros((n, 0), dtype = int)
+        self.meteor_tier = numpy.zeros((n, 0), dtype = int)
+        # index into the shape tables (see _init_shapes)
+        self.meteor_shape = numpy.zeros((n, 0), dtype = int)
+        self.meteor_alive = numpy.zeros((n, 0), dtype = bool)
+        self._grow(4)
+
+    def _init_shapes(self):
+        # tables of every meteor shape: the shape ids, and by index into those, the
+        #  tight radius (in unit space) and the edges, padded with nan
+        shapes = []
+        for points in tier_points:
+            for i in range(MeteorShapes.count):
+                shapes.append(MeteorShapes.get(points * MeteorShapes.count + i))
+        self.shape_index = dict((shape.id, i) for (i, shape) in enumerate(shapes))
+        self.shape_ids = numpy.array([shape.id for shape in shapes])
+        self.shape_radius = numpy.array([shape.radius for shape in shapes])
+        most = max(tier_points)
+        self.shape_edge_starts = numpy.full((len(shapes), most, 2), numpy.nan)
+        self.shape_edge_ends = numpy.full((len(shapes), most, 2), numpy.nan)
+        for (i, shape) in enumerate(shapes):
+            (starts, ends) = shape.edge_arrays()
+            self.shape_edge_starts[i, :len(starts)] = starts
+            self.shape_edge_ends[i, :len(ends)] = ends
+
+    def _meteor_arrays(self):
+        return ['meteor_pos', 'meteor_last_pos', 'meteor_vel', 'meteor_deg',
+                'meteor_turn_speed', 'meteor_health', 'meteor_tier', 'meteor_shape',
+                'meteor_alive']
+
+    def _grow(self, capacity):
+        # makes room for capacity meteors in every game
+        for name in self._meteor_arrays():
+            array = getattr(self, name)
+            shape = (array.shape[0], capacity) + array.shape[2:]
+            grown = numpy.zeros(shape, dtype = array.dtype)
+            grown[:, :array.shape[1]] = array
+            setattr(self, name, grown)
+
+    # starting games
+
+    def reset(self):
+        # starts all games over, returns the observations
+        for i in range(self.count):
+            self._start(i)
+        return self.observe()
+
+    def _start(self, i):
+        # starts game i at level 1 (Game._init_play)
+        self.score[i] = 0
+        self.level[i] = 1
+        self.steps[i] = 0
+        self._start_level(i)
+
+    def _start_level(self, i):
+        # clears game i and puts a new ship and level meteor1s in it (Game._init_play)
+        (winx, winy) = self.bounds.get_size()
+        self.ship_pos[i] = (winx / 2, winy / 2)
+        self.ship_vel[i] = 0
+        self.ship_deg[i] = 0
+        self.ship_last_pos[i] = self.ship_pos[i]
+        self.ship_last_deg[i] = 0
+        self.bullet_alive[i] = False
+        self.meteor_alive[i] = False
+        self._add_meteor1(i)
+
+    def _add_meteor1(self, i):
+        # Game.add_meteor1
+        (winx, winy) = self.bounds.get_size()
+        rng = self.random[i]
+        (ship_x, ship_y) = self.ship_pos[i]
+        last_poses = []
+        for k in range(self.level[i]):
+            search = True
+            while search:
+                (x, y) = (rng.uniform(0, winx), rng.uniform(0, winy))
+                search = False
+                for (last_x, last_y) in last_poses:
+                    if (x - last_x) ** 2 + (y - last_y) ** 2 < 20000:
+                        search = True
+                        break
+                if (x - ship_x) ** 2 + (y - ship_y) ** 2 < 20000:
+                    search = True
+            last_poses.append((x, y))
+            self._add_meteor(i, 0, x, y, rng.uniform(0, 360))
+
+    def _split(self, i, tier, x, y):
+        # Game.add_meteor2/add_meteor3: 3 meteors of tier, flying apart from x, y
+        rng = self.random[i]
+        count = 3
+        min_separation = 0.2 * (360 / count)
+        last_degs = []
+        for k in range(count):
+            search = True
+            while search:
+                deg = rng.uniform(0, 360)
+                search = False
+                for last_deg in last_degs:
+                    if abs(deg - last_deg) < min_separation:
+                        search = True
+                        break
+            last_degs.append(deg)
+            self._add_meteor(i, tier, x, y, deg)
+
+    def _add_meteor(self, i, tier, x, y, deg):
+        # Meteor.reset, into a free slot of game i
+        free = numpy.flatnonzero(~self.meteor_alive[i])
+        if len(free) == 0:
+            slot = self.meteor_alive.shape[1]
+            self._grow(2 * slot)
+        else:
+            slot = free[0]
+        rng = self.random[i]
+        shape = MeteorShapes.pick(tier_points[tier], rng)
+        self.meteor_pos[i, slot] = (x, y)
+        self.meteor_last_pos[i, slot] = (x, y)
+        self.meteor_vel[i, slot] = direction(deg) * tier_speed[tier]
+        self.meteor_deg[i, slot] = 0
+        self.meteor_turn_speed[i, slot] = rng.uniform(-20, 20)
+        self.meteor_health[i, slot] = tier_health[tier]
+        self.meteor_tier[i, slot] = tier
+        self.meteor_shape[i, slot] = self.shape_index[shape.id]
+        self.meteor_alive[i, slot] = True
+
+    # stepping
+
+    def step(self, actions):
+        # steps every game by fixed_dt with its row of actions (an (count, 3) array,
+        #  see TURN, THRUST and FIRE). returns the observations, the score each game
+        #  made this step, and which games ended (those have already started over)
+        actions = numpy.asarray(actions)
+        score = self.score.copy()
+        self._fire(actions[:, FIRE] > 0)
+        self._update_ship(actions[:, TURN], actions[:, THRUST])
+        self._update_bullets()
+        self._update_meteors()
+        dead = self._collide_ship()
+        self._collide_bullets()
+        rewards = self.score - score
+        self.steps += 1
+
+        for i in numpy.flatnonzero(dead):
+            self.last_score[i] = self.score[i]
+            self.last_level[i] = self.level[i]
+            self.last_steps[i] = self.steps[i]
+            self._start(i)
+        cleared = ~dead & ~self.meteor_alive.any(axis = 1)
+        for i in numpy.flatnonzero(cleared):
+            self.level[i] += 1
+            self._start_level(i)
+        return (self.observe(), rewards, dead)
+
+    def _fire(self, fire):
+        # Game.add_bullet, in the first free bullet slot
+        free = ~self.bullet_alive
+        fire = fire & free.any(axis = 1)
+        if not fire.any():
+            return
+        rows = numpy.flatnonzero(fire)
+        slots = numpy.argmax(free[rows], axis = 1)
+        heading = direction(self.ship_deg[rows])
+        pos = self.ship_pos[rows] + heading * (ship_size[1] / 2)
+        self.bullet_pos[rows, slots] = pos
+        self.bullet_last_pos[rows, slots] = pos
+        self.bullet_vel[rows, slots] = heading * bullet_speed
+        self.bullet_alive[rows, slots] = True
+
+    def _update_ship(self, turn, thrust):
+        # Ship.update
+        dt = self.fixed_dt
+        self.ship_vel += direction(self.ship_deg) * (ship_accel * dt * numpy.sign(thrust))[:, None]
+        self.ship_last_deg[:, 1] = self.ship_last_deg[:, 0]
+        self.ship_last_deg[:, 0] = self.ship_deg
+        self.ship_deg = (self.ship_deg + ship_turn_speed * dt * numpy.sign(turn)) % 360
+        self.ship_last_pos[:, 1] = self.ship_last_pos[:, 0]
+        self.ship_last_pos[:, 0] = self.ship_pos
+        self.ship_pos = (self.ship_pos + self.ship_vel * dt) % self.bounds.get_size()
+
+    def _update_bullets(self):
+        # Bullet.update
+        self.bullet_last_pos[:] = self.bullet_pos
+        self.bullet_pos += self.bullet_vel * self.fixed_dt
+        (winx, winy) = self.bounds.get_size()
+        (x, y) = (self.bullet_pos[:, :, 0], self.bullet_pos[:, :, 1])
+        self.bullet_alive &= (x >= 0) & (x <= winx) & (y >= 0) & (y <= winy)
+
+    def _update_meteors(self):
+        # Meteor.update (and MeteorStore.update)
+        dt = self.fixed_dt
+        self.meteor_last_pos[:] = self.meteor_pos
+        self.meteor_deg += self.meteor_turn_speed * dt
+        pos = self.meteor_pos
+        pos += self.meteor_vel * dt
+        size = tier_size[self.meteor_tier]
+        (winx, winy) = self.bounds.get_size()
+        (x, y) = (pos[:, :, 0], pos[:, :, 1])
+        x[:] = numpy.where(x < -size / 2, x + (1.5 * size + winx), x)
+        x[:] = numpy.where(x > winx + size, x - (1.5 * size + winx), x)
+        y[:] = numpy.where(y < -size, y + (1.5 * size + winy), y)
+        y[:] = numpy.where(y > winy + size, y - (1.5 * size + winy), y)
+
+    def _to_local(self, rows, slots, points):
+        # points (k, 2) in world space => the unit space of the meteors at rows, slots
+        #  (Meteor.to_local)
+        rad = numpy.radians(self.meteor_deg[rows, slots])
+        (sin, cos) = (numpy.sin(rad), numpy.cos(rad))
+        size = tier_size[self.meteor_tier[rows, slots]]
+        dx = points[:, 0] - self.meteor_pos[rows, slots, 0]
+        dy = points[:, 1] - self.meteor_pos[rows, slots, 1]
+        return numpy.stack([(dx * cos + dy * sin) / size + 0.5,
+                            (dy * cos - dx * sin) / size + 0.5], axis = 1)
+
+    def _sweep(self, rows, slots, starts, ends, inside = True):
+        # MeteorShape.sweep for k segments (world space) against the meteors at
+        #  rows, slots. returns how far along each segment it first touches the
+        #  outline (inf if it doesn't). segments starting inside touch it at 0,
+        #  unless inside is false
+        shape = self.meteor_shape[rows, slots]
+        return sweep_outlines(self._to_local(rows, slots, starts),
+                              self._to_local(rows, slots, ends),
+                              self.shape_edge_starts[shape], self.shape_edge_ends[shape],
+                              inside)
+
+    def _ship_points(self, pos, deg):
+        # the corners of the ships at pos (n, 2), deg (n,) in world space, (n, 4, 2)
+        rad = numpy.radians(deg)[:, None]
+        (sin, cos) = (numpy.sin(rad), numpy.cos(rad))
+        x = (ship_points[None, :, 0] - 0.5) * ship_size[0]
+        y = (ship_points[None, :, 1] - 0.5) * ship_size[1]
+        return numpy.stack([x * cos - y * sin + pos[:, 0:1],
+                            x * sin + y * cos + pos[:, 1:2]], axis = 2)
+
+    def _collide_ship(self):
+        # Game._cd_ship_meteor: the paths of the ship's corners since 2 steps back,
+        #  for the corners inside a meteor's bounding circle, against its edges.
+        #  returns which ships were hit
+        now = self._ship_points(self.ship_pos, self.ship_deg)
+        old = self._ship_points(self.ship_last_pos[:, 1], self.ship_last_deg[:, 1])
+        radius = self.shape_radius[self.meteor_shape] * tier_size[self.meteor_tier]
+        offset = now[:, :, None, :] - self.meteor_pos[:, None, :, :]
+        inside = (offset ** 2).sum(axis = 3) < radius[:, None, :] ** 2
+        inside &= self.meteor_alive[:, None, :]
+        (rows, corners, slots) = numpy.nonzero(inside)
+        dead = numpy.zeros(self.count, dtype = bool)
+        if len(rows):
+            time = self._sweep(rows, slots, old[rows, corners], now[rows, corners],
+                               inside = False)
+            dead[rows[numpy.isfinite(time)]] = True
+        return dead
+
+    def _collide_bullets(self):
+        # Game._collide_bullets_batched, for every game at once: each bullet hits the
+        #  first meteor in its way, hits are handled in order of time, then of bullet
+        radius = self.shape_radius[self.meteor_shape] * tier_size[self.meteor_tier]
+        moved = self.meteor_pos - self.meteor_last_pos
+        size = tier_size[self.meteor_tier][:, :, None]
+        moved = numpy.where(numpy.abs(moved) < size, moved, 0)
+        # (games, bullets, meteors, 2): the bullet paths relative to each meteor
+        start = self.bullet_last_pos[:, :, None, :] + moved[:, None, :, :]
+        touch = sweep_circles(start, self.bullet_pos[:, :, None, :],
+                              self.meteor_pos[:, None, :, :], radius[:, None, :])
+        touch &= self.bullet_alive[:, :, None] & self.meteor_alive[:, None, :]
+        (rows, bullets, slots) = numpy.nonzero(touch)
+        if len(rows) == 0:
+            return
+        time = self._sweep(rows, slots, start[rows, bullets, slots],
+                           self.bullet_pos[rows, bullets])
+        found = numpy.isfinite(time)
+        (rows, bullets, slots, time) = (rows[found], bullets[found], slots[found], time[found])
+        # the first hit of each bullet, then in order of time, then bullet
+        order = numpy.lexsort((slots, time, bullets, rows))
+        (rows, bullets, slots, time) = (rows[order], bullets[order], slots[order], time[order])
+        first = numpy.ones(len(rows), dtype = bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (bullets[1:] != bullets[:-1])
+        (rows, bullets, slots, time) = (rows[first], bullets[first], slots[first], time[first])
+        # the meteors split once all hits are handled, so none of them can take the
+        #  slot of a meteor that is hit later on
+        splits = []
+        for k in numpy.lexsort((bullets, time, rows)):
+            (i, bullet, slot) = (rows[k], bullets[k], slots[k])
+            if not self.meteor_alive[i, slot]:
+                continue
+            self.bullet_alive[i, bullet] = False
+            self.meteor_health[i, slot] -= 1
+            if self.meteor_health[i, slot] == 0:
+                # Game._ch_bullet_meteor1/2/3
+                self.meteor_alive[i, slot] = False
+                tier = self.meteor_tier[i, slot]
+                self.score[i] += tier_score[tier] * self.level[i]
+                if tier < 2:
+                    (x, y) = self.meteor_pos[i, slot]
+                    splits.append((i, tier + 1, x, y))
+        for (i, tier, x, y) in splits:
+            self._split(i, tier, x, y)
+
+    # observations
+
+    def observe(self):
+        # the observations, see VectorGame
+        n = self.count
+        ship = numpy.concatenate([self.ship_pos, self.ship_vel, self.ship_deg[:, None]], axis = 1)
+        offset = self.meteor_pos - self.ship_pos[:, None, :]
+        distance = numpy.where(self.meteor_alive, (offset ** 2).sum(axis = 2), numpy.inf)
+        nearest = numpy.argsort(distance, axis = 1, kind = 'stable')[:, :self.observed]
+        rows = numpy.arange(n)[:, None]
+        meteors = numpy.zeros((n, self.observed, 6))
+        k = nearest.shape[1]
+        radius = self.shape_radius[self.meteor_shape] * tier_size[self.meteor_tier]
+        meteors[:, :k, 0:2] = offset[rows, nearest]
+        meteors[:, :k, 2:4] = self.meteor_vel[rows, nearest]
+        meteors[:, :k, 4] = radius[rows, nearest]
+        meteors[:, :k, 5] = self.meteor_alive[rows, nearest]
+        meteors[:, :k] *= meteors[:, :k, 5:6]
+        bullets = numpy.concatenate([self.bullet_pos, self.bullet_vel,
+                                     self.bullet_alive[:, :, None]], axis = 2)
+        bullets *= bullets[:, :, 4:5]
+        return {
+            'ship': ship,
+            'meteors': meteors,
+            'bullets': bullets,
+            'score': self.score.copy(),
+            'level': self.level.copy()}